@@ -0,0 +1,123 @@
+"""
+Micro-benchmark of the JSON codec used for dbt artifacts and request bodies
+
+Usage: python benchmarks/json_codec.py [number_of_models]
+Compares the stdlib json module against orjson (if installed) on a synthetic
+manifest and catalog, and on encoding the record payloads built from them.
+"""
+import os
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dbt_docs_to_notion # noqa: E402
+
+
+def make_artifacts(number_of_models):
+  """A synthetic manifest and matching catalog; every tenth model is too wide for one table"""
+  nodes = {}
+  catalog_nodes = {}
+  for i in range(number_of_models):
+    number_of_columns = 120 if i % 10 == 0 else 40
+    nodes[f'model.benchmark.model_{i}'] = {
+      "resource_type": "model",
+      "name": f"model_{i}",
+      "description": f"Description for model {i} " * 10,
+      "columns": {
+        f"column_{j}": {
+          "name": f"column_{j}",
+          "description": f"Description for column {j} of model {i}",
+          "meta": {},
+          "data_type": None,
+          "constraints": [],
+          "quote": None,
+          "tags": [],
+        }
+        for j in range(number_of_columns)
+      },
+      "raw_code": f"select * from {{{{ ref('model_{i - 1}') }}}} where id > {i}\n" * 10,
+      "compiled_code": f"select * from analytics.model_{i - 1} where id > {i}\n" * 10,
+      "relation_name": f"analytics.model_{i}",
+      "depends_on": {"macros": [], "nodes": [f"model.benchmark.model_{i - 1}"]},
+      "tags": ["benchmark"],
+      "config": {
+        "enabled": True,
+        "materialized": "table",
+        "persist_docs": {},
+        "quoting": {},
+        "column_types": {},
+        "full_refresh": None,
+        "on_schema_change": "ignore",
+        "grants": {},
+        "packages": [],
+        "docs": {"show": True, "node_color": None},
+        "meta": {},
+      },
+      "checksum": {"name": "sha256", "checksum": f"{i:064x}"},
+      "created_at": 1700000000.0 + i,
+    }
+    catalog_nodes[f'model.benchmark.model_{i}'] = {
+      "metadata": {"type": "BASE TABLE", "schema": "analytics", "name": f"model_{i}", "owner": "analytics"},
+      "columns": {
+        f"COLUMN_{j}": {"type": "VARCHAR" if j % 2 else "NUMBER", "index": j + 1, "name": f"COLUMN_{j}"}
+        for j in range(number_of_columns)
+      },
+      "stats": {
+        "row_count": {"id": "row_count", "label": "Row Count", "value": 1000 * i, "include": True},
+        "bytes": {"id": "bytes", "label": "Approximate Size", "value": 4096 * i, "include": True},
+      },
+      "unique_id": f"model.benchmark.model_{i}",
+    }
+  manifest = {"nodes": nodes, "sources": {}, "exposures": {}}
+  catalog = {"nodes": catalog_nodes, "sources": {}}
+  return manifest, catalog
+
+
+def time_call(function, repeat=3):
+  best = float('inf')
+  for _ in range(repeat):
+    start_time = time.perf_counter()
+    function()
+    best = min(best, time.perf_counter() - start_time)
+  return best
+
+
+def main(argv):
+  number_of_models = int(argv[1]) if len(argv) > 1 else 5000
+  manifest, catalog = make_artifacts(number_of_models)
+  records = [
+    dbt_docs_to_notion.build_record('model', doc, 'benchmark_database_id')
+    for doc in dbt_docs_to_notion.extract_docs('model', manifest, catalog).values()
+  ]
+
+  codecs = {'stdlib json': None}
+  if dbt_docs_to_notion.orjson is not None:
+    codecs['orjson'] = dbt_docs_to_notion.orjson
+  else:
+    print('orjson is not installed, only timing the stdlib json module')
+
+  with tempfile.TemporaryDirectory() as tmp_dir:
+    os.makedirs(os.path.join(tmp_dir, 'target'))
+    artifacts_mb = 0
+    for artifact_name, artifact in [('manifest', manifest), ('catalog', catalog)]:
+      artifact_path = os.path.join(tmp_dir, 'target', f'{artifact_name}.json')
+      with open(artifact_path, 'wb') as f:
+        f.write(dbt_docs_to_notion.encode_json(artifact))
+      artifacts_mb += os.path.getsize(artifact_path) / 1e6
+    print(f'{number_of_models} models, {artifacts_mb:.1f} MB of manifest and catalog\n')
+
+    for codec_name, codec in codecs.items():
+      with patch.object(dbt_docs_to_notion, 'orjson', codec):
+        load_seconds = time_call(lambda: dbt_docs_to_notion.load_artifacts(tmp_dir))
+        encode_seconds = time_call(
+          lambda: [dbt_docs_to_notion.encode_json(record) for record in records]
+        )
+      print(f'{codec_name:>12}: load {load_seconds:.3f}s ({artifacts_mb / load_seconds:.0f} MB/s), '
+            f'encode {len(records)} record payloads {encode_seconds:.3f}s')
+
+
+if __name__ == '__main__':
+  main(sys.argv)
@@ -0,0 +1,38 @@
+"""
+Micro-benchmark of extracting docs from a manifest and rendering record payloads
+
+Usage: python benchmarks/render.py [number_of_models]
+"""
+import sys
+import time
+import tracemalloc
+
+from json_codec import dbt_docs_to_notion, make_artifacts
+
+
+def main(argv):
+  number_of_models = int(argv[1]) if len(argv) > 1 else 5000
+  manifest, catalog = make_artifacts(number_of_models)
+
+  tracemalloc.start()
+  start_time = time.perf_counter()
+  docs = dbt_docs_to_notion.extract_docs('model', manifest, catalog)
+  extract_seconds = time.perf_counter() - start_time
+  _, extract_peak = tracemalloc.get_traced_memory()
+  docs_size = tracemalloc.get_traced_memory()[0]
+  tracemalloc.reset_peak()
+
+  start_time = time.perf_counter()
+  for doc in docs.values():
+    dbt_docs_to_notion.build_record('model', doc, 'benchmark_database_id')
+  render_seconds = time.perf_counter() - start_time
+  _, render_peak = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+
+  print(f'{number_of_models} models')
+  print(f'extract: {extract_seconds:.3f}s, docs hold {docs_size / 1e6:.1f} MB (peak {extract_peak / 1e6:.1f} MB)')
+  print(f' render: {render_seconds:.3f}s, peak {render_peak / 1e6:.1f} MB')
+
+
+if __name__ == '__main__':
+  main(sys.argv)
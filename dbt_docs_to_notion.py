@@ -1,34 +1,276 @@
+import argparse
+import hashlib
 import json
 import os
 import sys
+import tempfile
+import threading
 import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
 
 import requests
 
+try:
+  import orjson
+except ImportError:
+  orjson = None # falls back to the stdlib json module
 
-DATABASE_PARENT_ID = os.environ['DATABASE_PARENT_ID']
-DATABASE_NAME = os.environ['DATABASE_NAME']
-NOTION_TOKEN = os.environ['NOTION_TOKEN']
+
+# environment variables the github action passes each resource type's database name in
+DATABASE_NAME_ENV_VARS = {
+  'model': 'DATABASE_NAME',
+  'seed': 'SEEDS_DATABASE_NAME',
+  'snapshot': 'SNAPSHOTS_DATABASE_NAME',
+  'source': 'SOURCES_DATABASE_NAME',
+  'exposure': 'EXPOSURES_DATABASE_NAME',
+}
+PAGE_SECTIONS = ('columns', 'raw_code', 'compiled_code') # every section a page body can have
+DEPENDENCIES_RELATION_PROPERTY = 'Upstream Models'
+# digest of the page body, stored on each record so unchanged bodies aren't rewritten
+BODY_DIGEST_PROPERTY = 'Page Body Digest'
 NUMERIC_ZERO_VALUE = -1
+MAX_SYNC_WORKERS = 8
+MAX_REQUEST_ATTEMPTS = 5
+REQUEST_TIMEOUT = (10, 60) # seconds to connect, and to wait between bytes of the response
+MAX_RECORD_RETRY_ROUNDS = 2 # failed records are re-queued after every other record was synced
+RECORD_RETRY_BACKOFF = 15.0 # seconds before the first retry round, doubling every round
 
 
-def make_request(endpoint, querystring='', method='GET', **request_kwargs):
-  time.sleep(0.34) # notion api limit is 3 requests per second
+class NotionAPIError(Exception):
+  """Raised when the Notion API answers with anything other than a 200"""
 
-  headers = {
-    'Authorization': NOTION_TOKEN,
-    'Content-Type': 'application/json',
-    'Notion-Version': '2022-02-22'
-  }
-  url = f'https://api.notion.com/v1/{endpoint}{querystring}'
-  resp = requests.request(method, url, headers=headers, **request_kwargs)
+  def __init__(self, status_code, response_text, method=None, url=None, request_body=None):
+    super().__init__(
+      f"Request returned status code {status_code}\nResponse text: {response_text}"
+    )
+    self.status_code = status_code
+    self.response_text = response_text
+    self.method = method
+    self.url = url
+    self.request_body = request_body
+
+
+class AdaptiveRateController:
+  """
+  Paces the requests of every sync thread, AIMD-style: the request rate and
+  in-flight concurrency grow additively while responses come back quickly, and
+  shrink multiplicatively on 429s and slow responses. Sustained 5xx responses
+  trip a circuit breaker that pauses all requests for a cooldown.
+  """
+
+  def __init__(self, requests_per_second=2.9, min_requests_per_second=0.5,
+               max_requests_per_second=4.0, concurrency=2, max_concurrency=4,
+               target_latency=2.0, circuit_breaker_threshold=5,
+               circuit_breaker_cooldown=30.0):
+    self.requests_per_second = requests_per_second
+    self.min_requests_per_second = min_requests_per_second
+    self.max_requests_per_second = max_requests_per_second
+    self.concurrency = float(concurrency)
+    self.max_concurrency = max_concurrency
+    self.target_latency = target_latency
+    self.circuit_breaker_threshold = circuit_breaker_threshold
+    self.circuit_breaker_cooldown = circuit_breaker_cooldown
+    self.condition = threading.Condition()
+    self.in_flight = 0
+    self.next_request_time = 0.0
+    self.latencies = deque(maxlen=50)
+    self.consecutive_server_errors = 0
+
+  def acquire(self):
+    """Blocks until a concurrency slot is free and the next rate slot comes up"""
+    with self.condition:
+      while self.in_flight >= int(self.concurrency):
+        self.condition.wait()
+      self.in_flight += 1
+      now = time.monotonic()
+      wait_time = self.next_request_time - now
+      self.next_request_time = max(now, self.next_request_time) + 1 / self.requests_per_second
+    if wait_time > 0:
+      time.sleep(wait_time)
+
+  def release(self, status_code, latency, retry_after=None):
+    """Feeds a response back into the controller; status_code None is a network error"""
+    with self.condition:
+      self.in_flight -= 1
+      now = time.monotonic()
+      if status_code == 429:
+        self._decrease()
+        # notion tells us how long to back off; everyone waits, not just this thread
+        self.next_request_time = max(self.next_request_time, now + (retry_after or 1))
+      elif status_code is None or status_code >= 500:
+        self._decrease()
+        self.consecutive_server_errors += 1
+        if self.consecutive_server_errors >= self.circuit_breaker_threshold:
+          print(f'{self.consecutive_server_errors} consecutive server errors, '
+                f'pausing requests for {self.circuit_breaker_cooldown}s')
+          self.next_request_time = max(self.next_request_time, now + self.circuit_breaker_cooldown)
+          self.consecutive_server_errors = 0
+      else:
+        self.consecutive_server_errors = 0
+        self.latencies.append(latency)
+        if self.latency_percentile(0.9) > self.target_latency:
+          self.concurrency = max(1.0, self.concurrency * 0.9)
+        else:
+          self._increase()
+      self.condition.notify_all()
+
+  def latency_percentile(self, percentile):
+    ordered = sorted(self.latencies)
+    return ordered[int(percentile * (len(ordered) - 1))] if ordered else 0.0
+
+  def _increase(self):
+    self.requests_per_second = min(
+      self.max_requests_per_second, self.requests_per_second + 0.05
+    )
+    self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
 
-  if not resp.status_code == 200:
-    raise Exception(
-      f"Request returned status code {resp.status_code}\nResponse text: {resp.text}"
+  def _decrease(self):
+    self.requests_per_second = max(
+      self.min_requests_per_second, self.requests_per_second / 2
     )
+    self.concurrency = max(1.0, self.concurrency / 2)
+
+
+class PayloadStats:
+  """Thread-safe tally of request body bytes sent, and of bytes trimmed from page payloads"""
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.bytes_sent = 0
+    self.bytes_saved = 0
+
+  def add(self, bytes_sent=0, bytes_saved=0):
+    with self.lock:
+      self.bytes_sent += bytes_sent
+      self.bytes_saved += bytes_saved
+
+  def reset(self):
+    with self.lock:
+      self.bytes_sent = 0
+      self.bytes_saved = 0
+
+  def summary(self):
+    with self.lock:
+      unminimized = self.bytes_sent + self.bytes_saved
+      saved_share = self.bytes_saved / unminimized if unminimized else 0
+      return (f'sent {self.bytes_sent / 1e6:.2f} MB of request bodies, '
+              f'saved {self.bytes_saved / 1e6:.2f} MB ({saved_share:.0%}) by minimizing page payloads')
+
+
+def load_json_artifact(path):
+  """Parses a dbt artifact, with orjson straight from bytes when it is installed"""
+  if orjson is not None:
+    with open(path, 'rb') as f:
+      return orjson.loads(f.read())
+  with open(path, encoding='utf-8') as f:
+    return json.load(f)
+
+
+def encode_json(obj, sort_keys=False):
+  """Compact utf-8 JSON for request bodies and digests, with orjson when installed"""
+  if orjson is not None:
+    return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS if sort_keys else 0)
+  return json.dumps(
+    obj, sort_keys=sort_keys, separators=(',', ':'), ensure_ascii=False
+  ).encode('utf-8')
+
+
+def get_retry_after(resp):
+  try:
+    return float(resp.headers.get('Retry-After'))
+  except (TypeError, ValueError):
+    return None
 
-  return resp.json()
+
+def is_idempotent(method, url):
+  """Creating a page or database, or appending blocks, twice would create duplicates"""
+  if method == 'POST':
+    return url.endswith('/query')
+  return not (method == 'PATCH' and url.endswith('/children'))
+
+
+class NotionClient:
+  """
+  An authenticated Notion API session; every thread sharing a client is paced
+  by its request controller, so share one client per integration token
+  """
+
+  def __init__(self, notion_token, request_controller=None):
+    self.notion_token = notion_token
+    self.session = requests.Session() # reuses connections across requests and sync threads
+    # notion api limit is an average of 3 requests per second
+    self.request_controller = request_controller or AdaptiveRateController()
+    self.payload_stats = PayloadStats()
+
+  def request(self, endpoint, querystring='', method='GET', **request_kwargs):
+    headers = {
+      'Authorization': self.notion_token,
+      'Content-Type': 'application/json',
+      'Notion-Version': '2022-02-22'
+    }
+    url = f'https://api.notion.com/v1/{endpoint}{querystring}'
+    request_kwargs.setdefault('timeout', REQUEST_TIMEOUT) # a stalled connection would hold its sync thread forever
+    request_body = request_kwargs.pop('json', None)
+    if request_body is not None:
+      request_kwargs['data'] = encode_json(request_body)
+      self.payload_stats.add(bytes_sent=len(request_kwargs['data']))
+
+    # a server error or timeout may come after the request was carried out, so
+    # only requests that are safe to repeat are retried on those; notion
+    # rejects rate limited requests and connection timeouts never reach it
+    retry_server_errors = is_idempotent(method, url)
+    for attempt in range(1, MAX_REQUEST_ATTEMPTS + 1):
+      self.request_controller.acquire()
+      start_time = time.monotonic()
+      resp = network_error = None
+      try:
+        resp = self.session.request(method, url, headers=headers, **request_kwargs)
+      except (requests.ConnectionError, requests.Timeout) as e:
+        network_error = e
+      finally:
+        # exactly once per acquire, whatever was raised, or the slot is never freed;
+        # anything other than a response counts as a network error
+        status_code = resp.status_code if resp is not None else None
+        retry_after = get_retry_after(resp) if status_code == 429 else None
+        self.request_controller.release(status_code, time.monotonic() - start_time, retry_after)
+
+      if network_error is not None:
+        if attempt == MAX_REQUEST_ATTEMPTS or not (
+          retry_server_errors or isinstance(network_error, requests.ConnectTimeout)
+        ):
+          raise network_error
+        time.sleep(2 ** (attempt - 1))
+        continue
+
+      if resp.status_code == 200:
+        return resp.json()
+      if attempt < MAX_REQUEST_ATTEMPTS:
+        if resp.status_code == 429:
+          continue # the controller holds every request back for retry_after
+        if resp.status_code >= 500 and retry_server_errors:
+          time.sleep(2 ** (attempt - 1))
+          continue
+      raise NotionAPIError(resp.status_code, resp.text, method, url, request_body)
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_default_client():
+  """A client for the NOTION_TOKEN environment variable, created on first use"""
+  global _default_client
+  with _default_client_lock:
+    if _default_client is None:
+      _default_client = NotionClient(os.environ['NOTION_TOKEN'])
+    return _default_client
+
+
+def make_request(endpoint, querystring='', method='GET', client=None, **request_kwargs):
+  client = client if client is not None else get_default_client()
+  return client.request(endpoint, querystring, method, **request_kwargs)
 
 
 def get_paths_or_empty(parent_object, paths_array, zero_value=''):
@@ -68,451 +310,1509 @@ def variable_rich_text_length(data):
     ]
 
 
-def main(argv=None):
-  if argv is None:
-    argv = sys.argv
-  if len(argv) > 2:
-    dbt_project_dir = argv[1]
-    model_records_to_write = argv[2:]
-  else:
-    dbt_project_dir = '.'
-    model_records_to_write = argv[1:]
-    print(f'No project dir specified, defaulting to {dbt_project_dir}')
-  print(f'Model records to write: {model_records_to_write}')
+def query_database_pages(database_id, client):
+  """Yields every page in the database, following Notion's query pagination"""
+  query_obj = {"page_size": 100} # notion api max page size
+  while True:
+    query_resp = make_request(
+      endpoint='databases/',
+      querystring=f'{database_id}/query',
+      method='POST',
+      client=client,
+      json=query_obj
+    )
+    yield from query_resp['results']
+    if not query_resp.get('has_more'):
+      return
+    query_obj = {"page_size": 100, "start_cursor": query_resp['next_cursor']}
 
-  ###### load nodes from dbt docs ######
-  with open(f'{dbt_project_dir}/target/manifest.json', encoding='utf-8') as f:
-    manifest = json.load(f)
-    manifest_nodes = manifest['nodes']
-
-  with open(f'{dbt_project_dir}/target/catalog.json', encoding='utf-8') as f:
-    catalog = json.load(f)
-    catalog_nodes = catalog['nodes']
-
-  models = {node_name: data
-            for (node_name, data)
-            in manifest_nodes.items() if data['resource_type'] == 'model'}
-
-  ###### create database if not exists ######
-  children_query_resp = make_request(
-    endpoint='blocks/',
-    querystring=f'{DATABASE_PARENT_ID}/children',
-    method='GET'
-  )
 
-  database_id = ''
-  for child in children_query_resp['results']:
-    if('child_database' in child
-        and child['child_database'] == {'title': DATABASE_NAME}):
-      database_id = child['id']
-      break
+def get_record_name(record):
+  """Reads the plain text of a database record's Name (title) property"""
+  title = get_paths_or_empty(record, [['properties', 'Name', 'title']], [])
+  return ''.join(text.get('plain_text', '') for text in title)
 
-  if database_id:
-    print(f'database {database_id} already exists, proceeding to update records!')
-  else:
-    database_obj = {
-      "title": [
-        {
-          "type": "text",
-          "text": {
-            "content": DATABASE_NAME,
-            "link": None
+
+def get_record_body_digest(record):
+  """Reads the body digest stored on a database record; '' for records written without one"""
+  rich_text = get_paths_or_empty(record, [['properties', BODY_DIGEST_PROPERTY, 'rich_text']], [])
+  return ''.join(text.get('plain_text', '') for text in rich_text)
+
+
+def prune_orphaned_records(resource_type, page_index, record_names, client):
+  """
+  Archive database records whose name matches no resource in the manifest
+  Works from the page index built by the single paginated scan of the database
+  Returns a failed result per record that couldn't be archived, rather than raising
+  """
+  orphaned_record_names = [
+    record_name for record_name in page_index if record_name not in record_names
+  ]
+  print(f'\nfound {len(orphaned_record_names)} orphaned records to archive')
+
+  failed_results = []
+  for record_name in orphaned_record_names:
+    record_id = page_index[record_name]
+    print(f'archiving orphaned record {record_id}')
+    try:
+      _record_archive_resp = make_request(
+        endpoint=f'pages/{record_id}',
+        querystring='',
+        method='PATCH',
+        client=client,
+        json={"archived": True}
+      )
+    except (NotionAPIError, requests.RequestException) as e:
+      # left in the page index, so the next sync tries again
+      print(f'\nfailed to archive {record_name} record: {e}')
+      failed_results.append(
+        RecordResult(resource_type, None, record_name, 'failed', record_id, e)
+      )
+      continue
+    del page_index[record_name]
+
+  return failed_results
+
+
+def get_depends_on_nodes(data):
+  """Returns the unique ids a node depends on; manifests nest these under 'nodes'"""
+  depends_on = data.get('depends_on') or {}
+  if isinstance(depends_on, dict):
+    return depends_on.get('nodes', [])
+  return depends_on
+
+
+def normalize_id(notion_id):
+  """Notion ids are returned both with and without dashes"""
+  return notion_id.replace('-', '')
+
+
+def build_dependency_index(models, record_ids_by_name):
+  """
+  Maps each model's record id to the sorted record ids of its upstream models
+  Upstream nodes without a record (sources, seeds, unwritten models) are dropped
+  """
+  dependency_index = {}
+  for doc in models.values():
+    record_id = record_ids_by_name.get(doc.name)
+    if record_id is None:
+      continue
+    upstream_record_ids = {
+      record_ids_by_name[models[dep].name]
+      for dep in doc.depends_on_nodes
+      if dep in models and models[dep].name in record_ids_by_name
+    }
+    dependency_index[record_id] = sorted(upstream_record_ids)
+  return dependency_index
+
+
+def sync_dependency_relations(models, written_record_ids, page_index, current_relations, client):
+  """
+  Second phase of the sync: point each record's relation property at the
+  records of its upstream models, only PATCHing records whose set changed;
+  records written in earlier syncs are diffed too, as an upstream record may
+  only just have been created
+  Returns a failed result per record whose relations couldn't be updated, rather than raising
+  """
+  record_ids_by_name = {
+    name: normalize_id(record_id)
+    for name, record_id in {**page_index, **written_record_ids}.items()
+  }
+
+  docs_by_record_id = {
+    record_ids_by_name[doc.name]: doc
+    for doc in models.values() if doc.name in record_ids_by_name
+  }
+  dependency_index = build_dependency_index(models, record_ids_by_name)
+
+  failed_results = []
+  for record_id, upstream_record_ids in dependency_index.items():
+    upstream_record_ids = upstream_record_ids[:100] # notion api limit is 100 relations per request
+    if current_relations.get(record_id, []) == upstream_record_ids:
+      continue
+    print(f'updating dependency relations for record {record_id}')
+    try:
+      _record_relation_update_resp = make_request(
+        endpoint=f'pages/{record_id}',
+        querystring='',
+        method='PATCH',
+        client=client,
+        json={
+          "properties": {
+            DEPENDENCIES_RELATION_PROPERTY: {
+              "relation": [{"id": upstream_id} for upstream_id in upstream_record_ids]
+            }
           }
         }
-      ],
-      "parent": {
-        "type": "page_id",
-        "page_id": DATABASE_PARENT_ID
-      },
-      "properties": {
-        "Name": {
-          "title": {}
-        },
-        "Description": {
-          "rich_text": {}
-        },
-        "Owner": {
-          "rich_text": {}
-        },
-        "Relation": {
-          "rich_text": {}
-        },
-        "Approx Rows": {
-          "number": {
-            "format": "number_with_commas"
-          }
-        },
-        "Approx GB": {
-          "number": {
-            "format": "number_with_commas"
-          }
-        },
-        "Depends On": {
-          "rich_text": {}
-        },
-        "Tags": {
-          "rich_text": {}
+      )
+    except (NotionAPIError, requests.RequestException) as e:
+      doc = docs_by_record_id[record_id]
+      print(f'\nfailed to update dependency relations of {doc.name} record: {e}')
+      failed_results.append(RecordResult('model', doc.unique_id, doc.name, 'failed', record_id, e))
+      continue
+    current_relations[record_id] = upstream_record_ids
+
+  return failed_results
+
+
+def load_artifacts(dbt_project_dir):
+  """Parse the manifest and catalog of a dbt project once, for every resource type"""
+  manifest = load_json_artifact(f'{dbt_project_dir}/target/manifest.json')
+  catalog = load_json_artifact(f'{dbt_project_dir}/target/catalog.json')
+  return manifest, catalog
+
+
+def load_project_docs(projects):
+  """
+  Parse the artifacts of several projects in parallel, one process per project;
+  each process extracts its project's docs, so only the compact docs come back
+  """
+  if len(projects) == 1:
+    return [load_docs(projects[0])]
+  with ProcessPoolExecutor(max_workers=min(len(projects), os.cpu_count() or 1)) as executor:
+    return list(executor.map(load_docs, projects))
+
+
+def get_resources(manifest, resource_type):
+  """Sources and exposures live in their own manifest sections; the rest are nodes"""
+  if resource_type == 'source':
+    return manifest.get('sources', {})
+  if resource_type == 'exposure':
+    return manifest.get('exposures', {})
+  return {node_name: data
+          for (node_name, data)
+          in manifest['nodes'].items() if data['resource_type'] == resource_type}
+
+
+def get_catalog_nodes(catalog, resource_type):
+  if resource_type == 'source':
+    return catalog.get('sources', {})
+  return catalog.get('nodes', {})
+
+
+def rich_text_property(content):
+  return {
+    "rich_text": [
+      {
+        "text": {
+          "content": str(content)[:2000] # notion api limit is 2k characters per rich text block
+        }
+      }
+    ]
+  }
+
+
+def title_property(content):
+  return {
+    "title": [
+      {
+        "text": {
+          "content": content
         }
       }
+    ]
+  }
+
+
+MODEL_DATABASE_PROPERTIES = {
+  "Name": {
+    "title": {}
+  },
+  "Description": {
+    "rich_text": {}
+  },
+  "Owner": {
+    "rich_text": {}
+  },
+  "Relation": {
+    "rich_text": {}
+  },
+  "Approx Rows": {
+    "number": {
+      "format": "number_with_commas"
+    }
+  },
+  "Approx GB": {
+    "number": {
+      "format": "number_with_commas"
     }
+  },
+  "Depends On": {
+    "rich_text": {}
+  },
+  "Tags": {
+    "rich_text": {}
+  }
+}
 
-    print('creating database')
-    database_creation_resp = make_request(
-      endpoint='databases/',
-      querystring='',
-      method='POST',
-      json=database_obj
+SEED_DATABASE_PROPERTIES = {
+  name: schema for name, schema in MODEL_DATABASE_PROPERTIES.items()
+  if name != 'Depends On'
+}
+
+SOURCE_DATABASE_PROPERTIES = {
+  **SEED_DATABASE_PROPERTIES,
+  "Loader": {
+    "rich_text": {}
+  }
+}
+
+EXPOSURE_DATABASE_PROPERTIES = {
+  "Name": {
+    "title": {}
+  },
+  "Description": {
+    "rich_text": {}
+  },
+  "Owner": {
+    "rich_text": {}
+  },
+  "Type": {
+    "select": {}
+  },
+  "Maturity": {
+    "select": {}
+  },
+  "URL": {
+    "url": {}
+  },
+  "Depends On": {
+    "rich_text": {}
+  },
+  "Tags": {
+    "rich_text": {}
+  }
+}
+
+
+MAX_COLUMN_ROWS = 98 # notion api limit is 100 table rows, less the header and truncation rows
+
+
+@dataclass(slots=True)
+class ColumnDoc:
+  name: str
+  type: str
+  description: str
+
+
+@dataclass(slots=True)
+class ModelDoc:
+  """
+  The parts of a model, seed, snapshot or source and its catalog entry that end
+  up in Notion, so the manifest node doesn't have to outlive artifact parsing
+  """
+  unique_id: str
+  name: str
+  description: str
+  owner: str
+  relation_name: str
+  approx_rows: float
+  approx_gb: float
+  depends_on_nodes: tuple
+  depends_on_text: str
+  tags_text: str
+  raw_code: str
+  compiled_code: str
+  columns: tuple
+  columns_truncated: bool
+  loader: str = ''
+
+  @classmethod
+  def from_node(cls, unique_id, data, catalog_nodes):
+    column_descriptions = {name: metadata.get('description', '')
+                           for name, metadata
+                           in data.get('columns', {}).items()}
+    catalog_columns = list(get_paths_or_empty(
+      catalog_nodes,
+      [[unique_id, 'columns']],
+      {}
+    ).items())
+    columns = tuple(
+      ColumnDoc(
+        name=col_name,
+        type=col_data['type'],
+        description=column_descriptions.get(col_name.lower(), '')
+      )
+      for col_name, col_data in catalog_columns[:MAX_COLUMN_ROWS]
     )
-    database_id = database_creation_resp['id']
-    print(f'\ncreated database {database_id}, proceeding to create records!')
 
-  ##### create / update database records #####
-  for model_name, data in sorted(list(models.items()), reverse=True):
-    if model_records_to_write == ['all'] or model_name.split(".")[-1] in model_records_to_write:
-      # form record object
-      column_descriptions = {name: metadata['description']
-                            for name, metadata
-                            in data['columns'].items()}
-
-      columns_table_children_obj = [
-        {
-          "type": "table_row",
-          "table_row": {
-            "cells": [
-              [
-                {
-                  "type": "text",
-                  "text": {
-                    "content": "Column"
-                  },
-                  "plain_text": "Column"
-                }
-              ],
-              [
-                {
-                  "type": "text",
-                  "text": {
-                    "content": "Type"
-                  },
-                  "plain_text": "Type"
-                }
-              ],
-              [
-                {
-                  "type": "text",
-                  "text": {
-                    "content": "Description"
-                  },
-                  "plain_text": "Description"
-                }
-              ]
-            ]
-          }
-        }
-      ]
-      col_names_and_data = list(get_paths_or_empty(
+    if data['resource_type'] == 'source':
+      name = f"{data['source_name']}.{data['name']}" # table names repeat across sources
+    elif data.get('version') is not None:
+      name = f"{data['name']}_v{data['version']}" # versions of a model share its name
+    else:
+      name = data['name']
+
+    return cls(
+      unique_id=unique_id,
+      name=name,
+      description=data.get('description', ''),
+      owner=str(get_owner(data, catalog_nodes, unique_id)),
+      relation_name=data.get('relation_name') or '',
+      approx_rows=get_paths_or_empty(
         catalog_nodes,
-        [[model_name, 'columns']],
-        {}
-      ).items())
-      for (col_name, col_data) in col_names_and_data[:98]: # notion api limit is 100 table rows
-        columns_table_children_obj.append(
-          {
-            "type": "table_row",
-            "table_row": {
-              "cells": [
-                [
-                  {
-                    "type": "text",
-                    "text": {
-                      "content": col_name
-                    },
-                    "plain_text": col_name
-                  }
-                ],
-                [
-                  {
-                    "type": "text",
-                    "text": {
-                      "content": col_data['type']
-                    },
-                    "plain_text": col_data['type']
-                  }
-                ],
-                [
-                  {
-                    "type": "text",
-                    "text": {
-                      "content": (
-                        column_descriptions[col_name.lower()]
-                        if col_name.lower() in column_descriptions
-                        else ''
-                      )
-                    },
-                    "plain_text": (
-                      column_descriptions[col_name.lower()]
-                      if col_name.lower() in column_descriptions
-                      else ''
-                    )
-                  }
-                ]
-              ]
-            }
-          }
-        )
-      if len(col_names_and_data) > 98:
-        # make that columns have been truncated
-        columns_table_children_obj.append(
-          {
-            "type": "table_row",
-            "table_row": {
-              "cells": [
-                [
-                  {
-                    "type": "text",
-                    "text": {
-                      "content": "..."
-                    },
-                    "plain_text": "..."
-                  }
-                ],
-                [
-                  {
-                    "type": "text",
-                    "text": {
-                      "content": "..."
-                    },
-                    "plain_text": "..."
-                  }
-                ],
-                [
-                  {
-                    "type": "text",
-                    "text": {
-                      "content": "..."
-                    },
-                    "plain_text": "..."
-                  }
-                ]
-              ]
-            }
-          }
-        )
+        [[unique_id, 'stats', 'num_rows', 'value'],
+         [unique_id, 'stats', 'row_count', 'value']],
+        NUMERIC_ZERO_VALUE
+      ),
+      approx_gb=get_paths_or_empty(
+        catalog_nodes,
+        [[unique_id, 'stats', 'bytes', 'value'],
+         [unique_id, 'stats', 'num_bytes', 'value']],
+        NUMERIC_ZERO_VALUE
+      ) / 1e9,
+      depends_on_nodes=tuple(get_depends_on_nodes(data)),
+      # displayed text stays in the stdlib format whichever codec is installed
+      depends_on_text=json.dumps(data.get('depends_on', {})),
+      tags_text=json.dumps(data.get('tags', [])),
+      raw_code=data.get('raw_code') or data.get('raw_sql', ''),
+      compiled_code=data.get('compiled_code') or data.get('compiled_sql', ''),
+      columns=columns,
+      columns_truncated=len(catalog_columns) > MAX_COLUMN_ROWS,
+      loader=data.get('loader', ''),
+    )
 
-      record_children_obj = [
-        # Table of contents
-        {
-          "object": "block",
-          "type": "table_of_contents",
-          "table_of_contents": {
-            "color": "default"
-          }
-        },
-        # Columns
-        {
-          "object": "block",
-          "type": "heading_1",
-          "heading_1": {
-            "rich_text": [
-              {
-                "type": "text",
-                "text": { "content": "Columns" }
-              }
-            ]
-          }
-        },
-        {
-          "object": "block",
-          "type": "table",
-          "table": {
-            "table_width": 3,
-            "has_column_header": True,
-            "has_row_header": False,
-            "children": columns_table_children_obj
-          }
-        },
-        # Raw Code
-        {
-          "object": "block",
-          "type": "heading_1",
-          "heading_1": {
-            "rich_text": [
-              {
-                "type": "text",
-                "text": { "content": "Raw Code" }
-              }
-            ]
-          }
-        },
-        {
-          "object": "block",
-          "type": "code",
-          "code": {
-            "rich_text": variable_rich_text_length(data.get("raw_code") or data.get("raw_sql", "")),
-            "language": "sql"
-          }
-        },
-        # Compiled Code
-        {
-          "object": "block",
-          "type": "heading_1",
-          "heading_1": {
-            "rich_text": [
-              {
-                "type": "text",
-                "text": { "content": "Compiled Code" }
-              }
-            ]
-          }
-        },
+
+@dataclass(slots=True)
+class ExposureDoc:
+  """The parts of an exposure that end up in Notion"""
+  unique_id: str
+  name: str
+  description: str
+  owner: str
+  type: str
+  maturity: str
+  url: str
+  depends_on_nodes: tuple
+  depends_on_text: str
+  tags_text: str
+
+  @classmethod
+  def from_node(cls, unique_id, data, catalog_nodes):
+    owner = data.get('owner') or {}
+    depends_on_nodes = tuple(get_depends_on_nodes(data))
+    return cls(
+      unique_id=unique_id,
+      name=data['name'],
+      description=data.get('description', ''),
+      owner=owner.get('name') or owner.get('email') or '',
+      type=data.get('type') or '',
+      maturity=data.get('maturity') or '',
+      url=data.get('url') or '',
+      depends_on_nodes=depends_on_nodes,
+      depends_on_text=json.dumps(list(depends_on_nodes)),
+      tags_text=json.dumps(data.get('tags', [])),
+    )
+
+
+def text_cell(content):
+  # plain_text is read-only, so it's left out rather than sent and ignored
+  return [
+    {
+      "type": "text",
+      "text": {
+        "content": content
+      }
+    }
+  ]
+
+
+def table_row(*cells):
+  return {
+    "type": "table_row",
+    "table_row": {
+      "cells": [text_cell(cell) for cell in cells]
+    }
+  }
+
+
+def heading_block(content):
+  return {
+    "object": "block",
+    "type": "heading_1",
+    "heading_1": {
+      "rich_text": [
         {
-          "object": "block",
-          "type": "code",
-          "code": {
-            "rich_text": variable_rich_text_length(data.get("compiled_code") or data.get("compiled_sql", "")),
-            "language": "sql"
-          }
+          "type": "text",
+          "text": { "content": content }
         }
       ]
+    }
+  }
 
-      record_obj = {
-        "parent": {
-          "database_id": database_id
-        },
-        "properties": {
-          "Name": {
-            "title": [
-              {
-                "text": {
-                  "content": data['name']
-                }
-              }
-            ]
-          },
-          "Description": {
-            "rich_text": [
-              {
-                "text": {
-                  "content": data['description'][:2000]
-                  # notion api limit is 2k characters per rich text block
-                }
-              }
-            ]
-          },
-          "Owner": {
-            "rich_text": [
-              {
-                "text": {
-                  "content": str(
-                    get_owner(data, catalog_nodes, model_name)
-                  )[:2000]
-                }
-              }
-            ]
-          },
-          "Relation": {
-            "rich_text": [
-              {
-                "text": {
-                  "content": data['relation_name'][:2000] if data['relation_name'] else ""
-                }
-              }
-            ]
-          },
-          "Approx Rows": {
-            "number": get_paths_or_empty(
-              catalog_nodes,
-              [[model_name, 'stats', 'num_rows', 'value'],
-               [model_name, 'stats', 'row_count', 'value']],
-              NUMERIC_ZERO_VALUE
-            )
-          },
-          "Approx GB": {
-            "number": get_paths_or_empty(
-              catalog_nodes,
-              [[model_name, 'stats', 'bytes', 'value'],
-               [model_name, 'stats', 'num_bytes', 'value']],
-              NUMERIC_ZERO_VALUE
-            ) / 1e9
-          },
-          "Depends On": {
-            "rich_text": [
-              {
-                "text": {
-                  "content": json.dumps(data['depends_on'])[:2000]
-                }
-              }
-            ]
-          },
-          "Tags": {
-            "rich_text": [
-              {
-                "text": {
-                  "content": json.dumps(data['tags'])[:2000]
-                }
-              }
-            ]
-          }
-        }
+
+def code_block(code):
+  return {
+    "object": "block",
+    "type": "code",
+    "code": {
+      "rich_text": variable_rich_text_length(code),
+      "language": "sql"
+    }
+  }
+
+
+# fragments that are identical on every page are built once and shared by every payload
+TABLE_OF_CONTENTS_BLOCK = {
+  "object": "block",
+  "type": "table_of_contents",
+  "table_of_contents": {
+    "color": "default"
+  }
+}
+COLUMNS_HEADING_BLOCK = heading_block("Columns")
+RAW_CODE_HEADING_BLOCK = heading_block("Raw Code")
+COMPILED_CODE_HEADING_BLOCK = heading_block("Compiled Code")
+COLUMNS_TABLE_HEADER_ROW = table_row("Column", "Type", "Description")
+COLUMNS_TABLE_TRUNCATED_ROW = table_row("...", "...", "...") # marks that columns have been truncated
+COMPILED_CODE_SAME_AS_RAW_BLOCK = {
+  "object": "block",
+  "type": "paragraph",
+  "paragraph": {
+    "rich_text": [
+      {
+        "type": "text",
+        "text": { "content": "Same as the raw code." }
       }
+    ]
+  }
+}
 
-      ###### query to see if record already exists ######
-      query_obj = {
-        "filter": {
-          "property": "Name",
-          "title": {
-            "equals": data['name']
-          }
+
+def render_columns_table(doc):
+  columns_table_children_obj = [COLUMNS_TABLE_HEADER_ROW]
+  columns_table_children_obj.extend(
+    table_row(column.name, column.type, column.description) for column in doc.columns
+  )
+  if doc.columns_truncated:
+    columns_table_children_obj.append(COLUMNS_TABLE_TRUNCATED_ROW)
+
+  return {
+    "object": "block",
+    "type": "table",
+    "table": {
+      "table_width": 3,
+      "has_column_header": True,
+      "has_row_header": False,
+      "children": columns_table_children_obj
+    }
+  }
+
+
+def render_columns_children(doc, page_sections):
+  """Page body for resources without code: table of contents and columns table"""
+  record_children_obj = [TABLE_OF_CONTENTS_BLOCK]
+  if 'columns' in page_sections:
+    record_children_obj += [COLUMNS_HEADING_BLOCK, render_columns_table(doc)]
+  return record_children_obj
+
+
+def render_code_children(doc, page_sections):
+  """Page body for models and snapshots, which also carry raw and compiled code"""
+  record_children_obj = render_columns_children(doc, page_sections)
+  if 'raw_code' in page_sections:
+    record_children_obj += [RAW_CODE_HEADING_BLOCK, code_block(doc.raw_code)]
+  if 'compiled_code' in page_sections:
+    record_children_obj.append(COMPILED_CODE_HEADING_BLOCK)
+    if doc.compiled_code == doc.raw_code and 'raw_code' in page_sections:
+      record_children_obj.append(COMPILED_CODE_SAME_AS_RAW_BLOCK)
+    else:
+      record_children_obj.append(code_block(doc.compiled_code))
+  return record_children_obj
+
+
+def get_bytes_saved(resource_type, doc, page_sections):
+  """
+  How many bytes the minimized page payload of a doc is smaller than one that
+  repeats every table cell as plain_text and always uploads the compiled code
+  """
+  render_children = RESOURCE_TYPES[resource_type]['render_children']
+  if render_children is render_no_children:
+    return 0
+
+  bytes_saved = 0
+  if 'columns' in page_sections:
+    cell_contents = ['Column', 'Type', 'Description']
+    for column in doc.columns:
+      cell_contents += [column.name, column.type, column.description]
+    if doc.columns_truncated:
+      cell_contents += ['...', '...', '...']
+    bytes_saved += sum(
+      len(b',"plain_text":') + len(encode_json(content)) for content in cell_contents
+    )
+
+  if (render_children is render_code_children
+      and {'raw_code', 'compiled_code'} <= set(page_sections)
+      and doc.compiled_code == doc.raw_code):
+    bytes_saved += (
+      len(encode_json(code_block(doc.compiled_code)))
+      - len(encode_json(COMPILED_CODE_SAME_AS_RAW_BLOCK))
+    )
+  return bytes_saved
+
+
+def render_no_children(doc, page_sections):
+  return []
+
+
+def render_seed_properties(doc):
+  return {
+    "Name": title_property(doc.name),
+    "Description": rich_text_property(doc.description),
+    "Owner": rich_text_property(doc.owner),
+    "Relation": rich_text_property(doc.relation_name),
+    "Approx Rows": {"number": doc.approx_rows},
+    "Approx GB": {"number": doc.approx_gb},
+    "Tags": rich_text_property(doc.tags_text)
+  }
+
+
+def render_model_properties(doc):
+  properties = render_seed_properties(doc)
+  properties["Depends On"] = rich_text_property(doc.depends_on_text)
+  return properties
+
+
+def render_source_properties(doc):
+  properties = render_seed_properties(doc)
+  properties["Loader"] = rich_text_property(doc.loader)
+  return properties
+
+
+def render_exposure_properties(doc):
+  return {
+    "Name": title_property(doc.name),
+    "Description": rich_text_property(doc.description),
+    "Owner": rich_text_property(doc.owner),
+    "Type": {"select": {"name": doc.type} if doc.type else None},
+    "Maturity": {"select": {"name": doc.maturity} if doc.maturity else None},
+    "URL": {"url": doc.url or None},
+    "Depends On": rich_text_property(doc.depends_on_text),
+    "Tags": rich_text_property(doc.tags_text)
+  }
+
+
+RESOURCE_TYPES = {
+  'model': {
+    'database_properties': MODEL_DATABASE_PROPERTIES,
+    'doc_class': ModelDoc,
+    'render_properties': render_model_properties,
+    'render_children': render_code_children,
+  },
+  'seed': {
+    'database_properties': SEED_DATABASE_PROPERTIES,
+    'doc_class': ModelDoc,
+    'render_properties': render_seed_properties,
+    'render_children': render_columns_children,
+  },
+  'snapshot': {
+    'database_properties': MODEL_DATABASE_PROPERTIES,
+    'doc_class': ModelDoc,
+    'render_properties': render_model_properties,
+    'render_children': render_code_children,
+  },
+  'source': {
+    'database_properties': SOURCE_DATABASE_PROPERTIES,
+    'doc_class': ModelDoc,
+    'render_properties': render_source_properties,
+    'render_children': render_columns_children,
+  },
+  'exposure': {
+    'database_properties': EXPOSURE_DATABASE_PROPERTIES,
+    'doc_class': ExposureDoc,
+    'render_properties': render_exposure_properties,
+    'render_children': render_no_children,
+  },
+}
+
+
+def extract_docs(resource_type, manifest, catalog):
+  """Compact docs for every resource of a type, keyed by unique id"""
+  doc_class = RESOURCE_TYPES[resource_type]['doc_class']
+  catalog_nodes = get_catalog_nodes(catalog, resource_type)
+  return {
+    unique_id: doc_class.from_node(unique_id, data, catalog_nodes)
+    for unique_id, data in get_resources(manifest, resource_type).items()
+  }
+
+
+def build_record(resource_type, doc, database_id, page_sections=PAGE_SECTIONS):
+  """The page properties and body blocks of a record"""
+  resource_spec = RESOURCE_TYPES[resource_type]
+  record_obj = {
+    "parent": {
+      "database_id": database_id
+    },
+    "properties": resource_spec['render_properties'](doc)
+  }
+  return record_obj, resource_spec['render_children'](doc, page_sections)
+
+
+def get_resource_database_names(database_names, overrides=None):
+  """Resource types to sync, mapped to their database names; unnamed types are skipped"""
+  database_names = {**database_names, **(overrides or {})}
+  unknown_resource_types = set(database_names) - set(RESOURCE_TYPES)
+  if unknown_resource_types:
+    raise ValueError(f'Unknown resource types: {sorted(unknown_resource_types)}')
+  database_names = {
+    resource_type: database_name
+    for resource_type, database_name in database_names.items() if database_name
+  }
+  if len(set(database_names.values())) != len(database_names):
+    raise ValueError(f'Each resource type needs its own database, got {database_names}')
+  return database_names
+
+
+def get_page_sections(page_sections):
+  """The sections record pages include, out of PAGE_SECTIONS"""
+  page_sections = frozenset(page_sections)
+  unknown_page_sections = page_sections - set(PAGE_SECTIONS)
+  if unknown_page_sections:
+    raise ValueError(f'Unknown page sections: {sorted(unknown_page_sections)}, expected some of {list(PAGE_SECTIONS)}')
+  return page_sections
+
+
+@dataclass
+class ExporterConfig:
+  """Where the docs go and what they look like; nothing is read from the environment"""
+  notion_token: str
+  database_parent_id: str
+  # resource type -> database name; resource types without a database aren't synced
+  database_names: dict
+  prune_orphaned_records: bool = False
+  link_model_dependencies: bool = False
+  page_sections: frozenset = frozenset(PAGE_SECTIONS)
+  # database name -> id of the existing database to use, instead of looking it up by name
+  database_ids: dict = field(default_factory=dict)
+  # JSON file remembering resolved database ids, so later runs skip the parent page scan
+  database_id_cache_path: str | None = None
+  # JSON file listing the records that failed to sync, with their failing request and response
+  dead_letter_path: str | None = None
+
+  def __post_init__(self):
+    self.database_names = get_resource_database_names(self.database_names)
+    self.page_sections = get_page_sections(self.page_sections)
+
+  @classmethod
+  def from_env(cls, environ=None):
+    """The configuration the github action passes as environment variables"""
+    environ = os.environ if environ is None else environ
+    database_names = {
+      resource_type: environ.get(env_var, '')
+      for resource_type, env_var in DATABASE_NAME_ENV_VARS.items()
+    }
+    database_names['model'] = environ['DATABASE_NAME']
+    page_sections = environ.get('PAGE_SECTIONS', ','.join(PAGE_SECTIONS))
+    return cls(
+      notion_token=environ['NOTION_TOKEN'],
+      database_parent_id=environ['DATABASE_PARENT_ID'],
+      database_names=database_names,
+      prune_orphaned_records=environ.get('PRUNE_ORPHANED_RECORDS', 'false').lower() == 'true',
+      link_model_dependencies=environ.get('LINK_MODEL_DEPENDENCIES', 'false').lower() == 'true',
+      page_sections={section.strip() for section in page_sections.split(',') if section.strip()},
+      database_ids={environ['DATABASE_NAME']: environ['DATABASE_ID']} if environ.get('DATABASE_ID') else {},
+      database_id_cache_path=environ.get('DATABASE_ID_CACHE_PATH') or None,
+      dead_letter_path=environ.get('DEAD_LETTER_PATH', 'dbt_docs_to_notion_dead_letters.json') or None,
+    )
+
+
+def get_child_databases(database_parent_id, client):
+  """Maps the title of each database under the parent page to its id, following pagination"""
+  child_databases = {}
+  request_kwargs = {}
+  while True:
+    children_query_resp = make_request(
+      endpoint='blocks/',
+      querystring=f'{database_parent_id}/children',
+      method='GET',
+      client=client,
+      **request_kwargs
+    )
+    for child in children_query_resp['results']:
+      if 'child_database' in child:
+        child_databases.setdefault(child['child_database'].get('title'), child['id'])
+    if not children_query_resp.get('has_more'):
+      return child_databases
+    request_kwargs = {'params': {'start_cursor': children_query_resp['next_cursor']}}
+
+
+def read_database_id_cache(cache_path):
+  """Database ids resolved by earlier runs, as parent page id -> database name -> id"""
+  try:
+    with open(cache_path, encoding='utf-8') as f:
+      cache = json.load(f)
+  except (FileNotFoundError, ValueError):
+    return {}
+  return cache if isinstance(cache, dict) else {}
+
+
+def write_database_id_cache(cache_path, cache):
+  cache_dir = os.path.dirname(os.path.abspath(cache_path))
+  os.makedirs(cache_dir, exist_ok=True)
+  with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=cache_dir, delete=False) as f:
+    json.dump(cache, f, indent=2, sort_keys=True)
+  os.replace(f.name, cache_path) # readers never see a half-written cache
+
+
+class DatabaseDirectory:
+  """
+  Resolves database names to the ids of databases under the parent page: pinned
+  ids first, then ids cached by earlier runs (each checked with a single GET),
+  and only then a paginated scan of the parent page's children, done at most once
+  """
+
+  def __init__(self, database_parent_id, client, database_ids=None, cache_path=None):
+    self.database_parent_id = database_parent_id
+    self.client = client
+    self.database_ids = database_ids or {}
+    self.cache_path = cache_path
+    self.cache = read_database_id_cache(cache_path) if cache_path else {}
+    self.child_databases = None
+    self.lock = threading.Lock()
+
+  def find(self, resource_type, database_name):
+    """Returns the id of the resource type's database, or None if it doesn't exist yet"""
+    # pinned by name, so projects with their own database names don't share a pinned one
+    if self.database_ids.get(database_name):
+      return self.database_ids[database_name]
+
+    with self.lock:
+      cached_ids = self.cache.get(self.database_parent_id, {})
+      database_id = cached_ids.get(database_name)
+      if database_id and self._is_valid(database_id, database_name):
+        return database_id
+
+      if self.child_databases is None:
+        self.child_databases = get_child_databases(self.database_parent_id, self.client)
+      database_id = self.child_databases.get(database_name)
+      if database_id is not None or database_name in cached_ids:
+        self._remember(database_name, database_id)
+      return database_id
+
+  def remember(self, database_name, database_id):
+    with self.lock:
+      self._remember(database_name, database_id)
+
+  def _remember(self, database_name, database_id):
+    cached_ids = self.cache.setdefault(self.database_parent_id, {})
+    if database_id is None:
+      cached_ids.pop(database_name, None)
+    else:
+      cached_ids[database_name] = database_id
+      if self.child_databases is not None:
+        self.child_databases[database_name] = database_id
+    if self.cache_path:
+      write_database_id_cache(self.cache_path, self.cache)
+
+  def _is_valid(self, database_id, database_name):
+    """Whether a cached id still points to the named database under the parent page"""
+    try:
+      database = make_request(
+        endpoint=f'databases/{database_id}',
+        querystring='',
+        method='GET',
+        client=self.client
+      )
+    except NotionAPIError as e:
+      if e.status_code in (400, 404): # malformed id, or deleted or no longer shared
+        return False
+      raise
+    title = ''.join(text.get('plain_text', '') for text in database.get('title', []))
+    parent_id = get_paths_or_empty(database, [['parent', 'page_id']], '')
+    return (not database.get('archived') and title == database_name
+            and normalize_id(parent_id) == normalize_id(self.database_parent_id))
+
+
+def get_or_create_database(resource_type, database_name, database_properties, databases, client):
+  """Returns the database id and whether it existed before this run"""
+  database_id = databases.find(resource_type, database_name)
+  if database_id is not None:
+    print(f'database {database_id} already exists, proceeding to update records!')
+    return database_id, True
+
+  database_obj = {
+    "title": [
+      {
+        "type": "text",
+        "text": {
+          "content": database_name,
+          "link": None
         }
       }
-      record_query_resp = make_request(
-        endpoint='databases/',
-        querystring=f'{database_id}/query',
-        method='POST',
-        json=query_obj
+    ],
+    "parent": {
+      "type": "page_id",
+      "page_id": databases.database_parent_id
+    },
+    "properties": database_properties
+  }
+
+  print(f'creating database {database_name}')
+  database_creation_resp = make_request(
+    endpoint='databases/',
+    querystring='',
+    method='POST',
+    client=client,
+    json=database_obj
+  )
+  database_id = database_creation_resp['id']
+  databases.remember(database_name, database_id)
+  print(f'\ncreated database {database_id}, proceeding to create records!')
+  return database_id, False
+
+
+def find_record(state, record_name, client, lookup_title=False):
+  """
+  Looks the record up in the page index if one was built, else queries by title
+  lookup_title queries records missing from the index too, e.g. when retrying a
+  creation that may have gone through despite failing
+  Returns its id and stored body digest, or None and '' if there is no such record
+  """
+  if state.page_index is not None and (record_name in state.page_index or not lookup_title):
+    return state.page_index.get(record_name), state.body_digests.get(record_name, '')
+
+  query_obj = {
+    "filter": {
+      "property": "Name",
+      "title": {
+        "equals": record_name
+      }
+    }
+  }
+  record_query_resp = make_request(
+    endpoint='databases/',
+    querystring=f'{state.database_id}/query',
+    method='POST',
+    client=client,
+    json=query_obj
+  )
+  if record_query_resp['results']:
+    record = record_query_resp['results'][0]
+    return record['id'], get_record_body_digest(record)
+  return None, ''
+
+
+def update_record_properties(record_id, record_name, record_obj, client):
+  """Updates the properties of an existing record, leaving its body alone"""
+  print(f'\nupdating {record_name} record properties')
+  _record_update_resp = make_request(
+    endpoint=f'pages/{record_id}',
+    querystring='',
+    method='PATCH',
+    client=client,
+    json=record_obj
+  )
+
+
+def write_record(record_id, record_name, record_obj, record_children_obj, client):
+  """Creates the record, or updates it in place if it exists; returns its id"""
+  if record_id:
+    print(f'\nupdating {record_name} record')
+    # children can't be updated via record update, so we'll delete and re-add
+    record_children_resp = make_request(
+      endpoint='blocks/',
+      querystring=f'{record_id}/children',
+      method='GET',
+      client=client
+    )
+    for record_child in record_children_resp['results']:
+      record_child_id = record_child['id']
+      _record_child_deletion_resp = make_request(
+        endpoint='blocks/',
+        querystring=record_child_id,
+        method='DELETE',
+        client=client
+      )
+
+    if record_children_obj:
+      _record_children_replacement_resp = make_request(
+        endpoint='blocks/',
+        querystring=f'{record_id}/children',
+        method='PATCH',
+        client=client,
+        json={"children": record_children_obj}
       )
 
-      if record_query_resp['results']:
-        print(f'\nupdating {model_name} record')
-        record_id = record_query_resp['results'][0]['id']
-        _record_update_resp = make_request(
-          endpoint=f'pages/{record_id}',
-          querystring='',
-          method='PATCH',
-          json=record_obj
+    # properties go last: they carry the body digest, which must only match a complete body
+    _record_update_resp = make_request(
+      endpoint=f'pages/{record_id}',
+      querystring='',
+      method='PATCH',
+      client=client,
+      json=record_obj
+    )
+    return record_id
+
+  print(f'\ncreating {record_name} record')
+  record_obj['children'] = record_children_obj
+  record_creation_resp = make_request(
+    endpoint='pages/',
+    querystring='',
+    method='POST',
+    client=client,
+    json=record_obj
+  )
+  return record_creation_resp['id']
+
+
+@dataclass
+class DatabaseState:
+  """What a sync knows about one database; kept warm between syncs by an exporter"""
+  database_id: str = ''
+  # record name -> record id, or None when records are looked up one at a time
+  page_index: dict | None = None
+  # record id -> sorted record ids of upstream models, as last read or written
+  relations: dict = field(default_factory=dict)
+  # record name -> digest of the payload last written for it
+  record_digests: dict = field(default_factory=dict)
+  # record name -> body digest stored on the record, as last read or written
+  body_digests: dict = field(default_factory=dict)
+
+
+@dataclass(slots=True)
+class RecordResult:
+  """What a sync did with one resource's record"""
+  resource_type: str
+  unique_id: str | None # None for orphaned records, which have no resource
+  name: str
+  action: str # 'created', 'updated', 'properties_updated', 'unchanged' or 'failed'
+  record_id: str | None = None
+  error: Exception | None = None
+
+
+def is_retryable(error):
+  """Rate limits, server errors and network errors may go away; other errors won't"""
+  if isinstance(error, NotionAPIError):
+    return error.status_code == 429 or error.status_code >= 500
+  return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+def get_dead_letter(result):
+  """A failed record with the request and response that failed it, for the dead-letter file"""
+  dead_letter = {
+    'resource_type': result.resource_type,
+    'unique_id': result.unique_id,
+    'name': result.name,
+    'error': str(result.error),
+  }
+  if isinstance(result.error, NotionAPIError):
+    dead_letter['request'] = {
+      'method': result.error.method,
+      'url': result.error.url,
+      'body': result.error.request_body,
+    }
+    dead_letter['response'] = {
+      'status_code': result.error.status_code,
+      'text': result.error.response_text,
+    }
+  return dead_letter
+
+
+def write_dead_letters(dead_letter_path, results):
+  with open(dead_letter_path, 'w', encoding='utf-8') as f:
+    json.dump(
+      [get_dead_letter(result) for result in results if result.action == 'failed'],
+      f,
+      indent=2,
+      ensure_ascii=False
+    )
+
+
+def get_results_summary(results):
+  action_counts = {}
+  for result in results:
+    action_counts[result.action] = action_counts.get(result.action, 0) + 1
+  return f'{len(results)} records: ' + ', '.join(
+    f'{count} {action}' for action, count in sorted(action_counts.items())
+  )
+
+
+def get_digest(obj):
+  return hashlib.sha256(encode_json(obj, sort_keys=True)).hexdigest()
+
+
+def index_database(state, client):
+  """Reads every record of the database once, with a paginated scan"""
+  state.page_index = {}
+  for record in query_database_pages(state.database_id, client):
+    record_name = get_record_name(record)
+    if record_name not in state.page_index:
+      state.page_index[record_name] = record['id']
+      state.body_digests[record_name] = get_record_body_digest(record)
+    relation = get_paths_or_empty(
+      record,
+      [['properties', DEPENDENCIES_RELATION_PROPERTY, 'relation']],
+      []
+    )
+    state.relations[normalize_id(record['id'])] = sorted(
+      normalize_id(related['id']) for related in relation
+    )
+
+
+def sync_record(resource_type, doc, state, config, client, retrying=False):
+  """
+  Builds and writes one record, unless it is unchanged since it was last written
+  When only its properties changed, the body is left alone instead of rewritten
+  Returns its result, payload digest and body digest
+  """
+  record_name = doc.name
+  record_obj, record_children_obj = build_record(
+    resource_type, doc, state.database_id, config.page_sections
+  )
+  body_digest = get_digest(record_children_obj)
+  record_obj['properties'][BODY_DIGEST_PROPERTY] = rich_text_property(body_digest)
+  record_digest = get_digest(record_obj) # covers the body through its digest
+  if state.record_digests.get(record_name) == record_digest:
+    record_id = state.page_index.get(record_name) if state.page_index is not None else None
+    result = RecordResult(resource_type, doc.unique_id, record_name, 'unchanged', record_id)
+    return result, record_digest, body_digest
+
+  try:
+    record_id, stored_body_digest = find_record(state, record_name, client, lookup_title=retrying)
+    if record_id and stored_body_digest == body_digest:
+      # e.g. a stats refresh after a dbt run, one request instead of a body rewrite
+      update_record_properties(record_id, record_name, record_obj, client)
+      action = 'properties_updated'
+    else:
+      action = 'updated' if record_id else 'created'
+      record_id = write_record(record_id, record_name, record_obj, record_children_obj, client)
+      client.payload_stats.add(bytes_saved=get_bytes_saved(resource_type, doc, config.page_sections))
+  except (NotionAPIError, requests.RequestException) as e:
+    # one bad record shouldn't stop the others from syncing
+    print(f'\nfailed to write {record_name} record: {e}')
+    result = RecordResult(resource_type, doc.unique_id, record_name, 'failed', error=e)
+    return result, record_digest, body_digest
+  result = RecordResult(resource_type, doc.unique_id, record_name, action, record_id)
+  return result, record_digest, body_digest
+
+
+def get_docs_to_write(docs, records_to_write):
+  return [
+    doc for unique_id, doc in sorted(list(docs.items()), reverse=True)
+    if records_to_write == ['all'] or unique_id.split(".")[-1] in records_to_write
+  ]
+
+
+def sync_resource_type(resource_type, database_name, docs, databases,
+                       records_to_write, config, client, state=None, index_records=False):
+  """
+  Sync every resource of one type into its own database, returning a result per record
+  Pass the same state to later syncs to skip database discovery and indexing
+  """
+  resource_spec = RESOURCE_TYPES[resource_type]
+  link_dependencies = config.link_model_dependencies and resource_type == 'model'
+  state = state if state is not None else DatabaseState()
+
+  if not state.database_id:
+    ###### create database if not exists ######
+    state.database_id, database_preexisted = get_or_create_database(
+      resource_type,
+      database_name,
+      {**resource_spec['database_properties'], BODY_DIGEST_PROPERTY: {"rich_text": {}}},
+      databases,
+      client
+    )
+
+    database_update_properties = {}
+    if database_preexisted:
+      # databases created by older versions don't have the body digest property yet
+      database_update_properties[BODY_DIGEST_PROPERTY] = {"rich_text": {}}
+    if link_dependencies:
+      # a relation can only target a database that already exists, so add it afterwards
+      database_update_properties[DEPENDENCIES_RELATION_PROPERTY] = {
+        "relation": {"database_id": state.database_id}
+      }
+    if database_update_properties:
+      _database_update_resp = make_request(
+        endpoint=f'databases/{state.database_id}',
+        querystring='',
+        method='PATCH',
+        client=client,
+        json={"properties": database_update_properties}
+      )
+
+    ###### index existing records with one paginated scan ######
+    # per-record title queries are cheaper when writing only a handful of records
+    if not database_preexisted:
+      state.page_index = {}
+    elif (records_to_write == ['all'] or index_records
+          or config.prune_orphaned_records or link_dependencies):
+      index_database(state, client)
+
+  ##### create / update database records #####
+  pending_docs = get_docs_to_write(docs, records_to_write)
+  results = {}
+  written_record_ids = {}
+  for retry_round in range(MAX_RECORD_RETRY_ROUNDS + 1):
+    if retry_round:
+      backoff = RECORD_RETRY_BACKOFF * 2 ** (retry_round - 1)
+      print(f'\nretrying {len(pending_docs)} failed records in {backoff:.0f}s')
+      time.sleep(backoff)
+
+    # records are written concurrently; the request controller decides how many run at once
+    with ThreadPoolExecutor(max_workers=client.request_controller.max_concurrency) as executor:
+      futures = [
+        executor.submit(sync_record, resource_type, doc, state, config, client, retry_round > 0)
+        for doc in pending_docs
+      ]
+      retryable_docs = []
+      for doc, future in zip(pending_docs, futures):
+        result, record_digest, body_digest = future.result()
+        results[doc.unique_id] = result
+        if result.action == 'failed':
+          if is_retryable(result.error):
+            retryable_docs.append(doc)
+        elif result.action != 'unchanged':
+          written_record_ids[result.name] = result.record_id
+          state.record_digests[result.name] = record_digest
+          state.body_digests[result.name] = body_digest
+          if state.page_index is not None:
+            state.page_index[result.name] = result.record_id
+
+    pending_docs = retryable_docs
+    if not pending_docs:
+      break
+
+  ##### link records to the records of their upstream models #####
+  if link_dependencies:
+    for result in sync_dependency_relations(
+      docs, written_record_ids, state.page_index, state.relations, client
+    ):
+      results[result.unique_id] = result
+      state.record_digests.pop(result.name, None) # so the next sync writes it again
+
+  ##### archive records for resources no longer in the project #####
+  failed_archive_results = []
+  if config.prune_orphaned_records and state.page_index is not None:
+    record_names = {doc.name for doc in docs.values()}
+    failed_archive_results = prune_orphaned_records(
+      resource_type, state.page_index, record_names | set(docs.keys()), client
+    )
+
+  return list(results.values()) + failed_archive_results
+
+
+def run_syncs(sync_tasks, databases, records_to_write, config, client,
+              states=None, index_records=False):
+  """
+  Syncs run concurrently, sharing the artifacts, database directory and client;
+  states maps each (resource type, database name) to its state
+  A sync that fails before writing its records (e.g. creating or indexing its
+  database) returns them as failed, without stopping the other syncs
+  """
+  states = states if states is not None else {}
+  client.payload_stats.reset()
+  with ThreadPoolExecutor(max_workers=min(len(sync_tasks), MAX_SYNC_WORKERS) or 1) as executor:
+    futures = {
+      sync_task: executor.submit(
+        sync_resource_type,
+        sync_task[0],
+        sync_task[1],
+        docs,
+        databases,
+        records_to_write,
+        config,
+        client,
+        states.setdefault(sync_task, DatabaseState()),
+        index_records
+      )
+      for sync_task, docs in sync_tasks.items()
+    }
+    results = []
+    for (resource_type, database_name), future in futures.items():
+      try:
+        results.extend(future.result())
+      except (NotionAPIError, requests.RequestException) as e:
+        print(f'\nfailed to sync {resource_type} database {database_name}: {e}')
+        # a partly built page index would make existing records look missing
+        states[(resource_type, database_name)] = DatabaseState()
+        results.extend(
+          RecordResult(resource_type, doc.unique_id, doc.name, 'failed', error=e)
+          for doc in get_docs_to_write(sync_tasks[(resource_type, database_name)], records_to_write)
         )
+  print(f'\n{client.payload_stats.summary()}')
+  print(get_results_summary(results))
+  return results
+
+
+def extract_project_docs(project, manifest, catalog):
+  """Compact docs of one project, keyed by the (resource type, database name) they sync to"""
+  return {
+    (resource_type, database_name): extract_docs(resource_type, manifest, catalog)
+    for resource_type, database_name in project['database_names'].items()
+  }
+
+
+def load_docs(project):
+  return extract_project_docs(project, *load_artifacts(project['project_dir']))
+
 
-        # children can't be updated via record update, so we'll delete and re-add
-        record_children_resp = make_request(
-          endpoint='blocks/',
-          querystring=f'{record_id}/children',
-          method='GET'
+def merge_project_docs(project_docs):
+  """
+  Merge the docs of every project that syncs a resource type into the same
+  database, so each database is indexed, written and pruned exactly once
+  Records are looked up by name, so different resources of different projects
+  that share a name (e.g. a stg_customers model in both) can't share a database
+  """
+  sync_tasks = {}
+  record_owners = {} # (sync task, record name) -> index of its project, unique id
+  for project_index, docs_by_database in enumerate(project_docs):
+    for sync_task, docs in docs_by_database.items():
+      for unique_id, doc in docs.items():
+        owner_index, owner_unique_id = record_owners.setdefault(
+          (sync_task, doc.name), (project_index, unique_id)
         )
-        for record_child in record_children_resp['results']:
-          record_child_id = record_child['id']
-          _record_child_deletion_resp = make_request(
-            endpoint='blocks/',
-            querystring=record_child_id,
-            method='DELETE'
+        if owner_index != project_index and owner_unique_id != unique_id:
+          raise ValueError(
+            f'Database {sync_task[1]} would have several records named {doc.name}: '
+            f'{sorted([owner_unique_id, unique_id])}; configure separate database names for their projects'
           )
+      sync_tasks.setdefault(sync_task, {}).update(docs)
 
-        _record_children_replacement_resp = make_request(
-          endpoint='blocks/',
-          querystring=f'{record_id}/children',
-          method='PATCH',
-          json={"children": record_children_obj}
-        )
+  database_resource_types = {}
+  for resource_type, database_name in sync_tasks:
+    database_resource_types.setdefault(database_name, []).append(resource_type)
+  for database_name, resource_types in database_resource_types.items():
+    if len(resource_types) > 1:
+      raise ValueError(f'Database {database_name} is configured for several resource types: {resource_types}')
 
-      else:
-        print(f'\ncreating {model_name} record')
-        record_obj['children'] = record_children_obj
-        _record_creation_resp = make_request(
-          endpoint='pages/',
-          querystring='',
-          method='POST',
-          json=record_obj
-        )
+  return sync_tasks
+
+
+def group_sync_tasks(projects, project_artifacts):
+  return merge_project_docs([
+    extract_project_docs(project, manifest, catalog)
+    for project, (manifest, catalog) in zip(projects, project_artifacts)
+  ])
+
+
+class NotionDocsExporter:
+  """
+  Exports dbt docs to Notion from in-memory artifacts, e.g. from an orchestrator
+  after each dbt build. One exporter keeps its HTTP session, request controller,
+  database ids, page indexes and record digests across exports, so reuse it:
+  later exports skip discovery and only write the records that changed.
+  """
+
+  def __init__(self, config, client=None):
+    self.config = config
+    self.client = client or NotionClient(config.notion_token)
+    self.databases = DatabaseDirectory(
+      config.database_parent_id,
+      self.client,
+      config.database_ids,
+      config.database_id_cache_path
+    )
+    self.states = {}
+    self.lock = threading.Lock() # exports share state, so they run one at a time
+
+  @classmethod
+  def from_env(cls, environ=None):
+    return cls(ExporterConfig.from_env(environ))
+
+  def export(self, manifest, catalog, records_to_write=('all',), database_names=None):
+    """
+    Syncs the docs of one project's parsed manifest and catalog, returning a
+    RecordResult per resource; database_names overrides the configured names
+    """
+    project = {
+      'database_names': get_resource_database_names(self.config.database_names, database_names),
+    }
+    return self.export_projects([project], [(manifest, catalog)], records_to_write)
+
+  def export_projects(self, projects, project_artifacts, records_to_write=('all',)):
+    """Syncs several projects at once; see group_sync_tasks"""
+    return self.sync(group_sync_tasks(projects, project_artifacts), records_to_write)
+
+  def sync(self, sync_tasks, records_to_write=('all',), index_records=False):
+    """
+    Records that fail to sync are returned with action 'failed' and their error,
+    and written to the configured dead-letter file, rather than raised
+    """
+    with self.lock:
+      results = run_syncs(
+        sync_tasks,
+        self.databases,
+        list(records_to_write),
+        self.config,
+        self.client,
+        self.states,
+        index_records
+      )
+    if self.config.dead_letter_path:
+      # written even when nothing failed, so failures of an earlier sync don't linger
+      write_dead_letters(self.config.dead_letter_path, results)
+      if any(result.action == 'failed' for result in results):
+        print(f'wrote failed records to {self.config.dead_letter_path}')
+    return results
+
+
+def get_artifact_mtimes(dbt_project_dir):
+  """Modification times of the project's artifacts; None for any that are missing"""
+  mtimes = []
+  for artifact_name in ('manifest.json', 'catalog.json'):
+    try:
+      mtimes.append(os.stat(f'{dbt_project_dir}/target/{artifact_name}').st_mtime_ns)
+    except FileNotFoundError:
+      mtimes.append(None)
+  return tuple(mtimes)
+
+
+def watch(exporter, projects, records_to_write, poll_interval=2.0, debounce=5.0):
+  """
+  Keep the projects' docs in memory, and have the exporter re-sync them
+  whenever a project's artifacts change and then stay unchanged for `debounce`
+  seconds; only records whose content changed are written
+  """
+  project_dirs = [project['project_dir'] for project in projects]
+  project_docs = load_project_docs(projects)
+  synced_mtimes = [get_artifact_mtimes(dbt_project_dir) for dbt_project_dir in project_dirs]
+  exporter.sync(merge_project_docs(project_docs), records_to_write, index_records=True)
+  print('\nwatching for new dbt artifacts, press ctrl+c to stop')
+
+  pending_mtimes, pending_since = synced_mtimes, time.monotonic()
+  try:
+    while True:
+      time.sleep(poll_interval)
+      mtimes = [get_artifact_mtimes(dbt_project_dir) for dbt_project_dir in project_dirs]
+      if mtimes != pending_mtimes:
+        # dbt may still be writing, wait for the artifacts to settle
+        pending_mtimes, pending_since = mtimes, time.monotonic()
+        continue
+      if mtimes == synced_mtimes or time.monotonic() - pending_since < debounce:
+        continue
+
+      changed = [i for i, (new, old) in enumerate(zip(mtimes, synced_mtimes)) if new != old]
+      synced_mtimes = mtimes
+      print(f'\nartifacts changed in {[project_dirs[i] for i in changed]}, syncing')
+      try:
+        changed_docs = load_project_docs([projects[i] for i in changed])
+      except (OSError, ValueError) as e:
+        print(f'could not load artifacts, waiting for the next change: {e}')
+        continue
+      for i, docs in zip(changed, changed_docs):
+        project_docs[i] = docs
+
+      try:
+        sync_tasks = merge_project_docs(project_docs)
+      except ValueError as e:
+        print(f'could not merge project docs, waiting for the next change: {e}')
+        continue
+      try:
+        exporter.sync(sync_tasks, records_to_write, index_records=True)
+      except (NotionAPIError, requests.RequestException) as e:
+        print(f'sync failed, waiting for the next change: {e}')
+  except KeyboardInterrupt:
+    print('\nstopped watching')
+
+
+def read_projects_config(config_path, database_names):
+  """
+  Reads a JSON list of projects, either as dbt project dirs or as objects like
+  {"project_dir": "...", "database_names": {"model": "...", "source": "..."}}
+  """
+  with open(config_path, encoding='utf-8') as f:
+    config = json.load(f)
+
+  projects = []
+  for entry in config.get('projects', []) if isinstance(config, dict) else config:
+    if isinstance(entry, str):
+      entry = {'project_dir': entry}
+    projects.append({
+      'project_dir': entry['project_dir'],
+      'database_names': get_resource_database_names(database_names, entry.get('database_names')),
+    })
+  return projects
+
+
+def parse_args(argv):
+  parser = argparse.ArgumentParser(description='Exports dbt docs to Notion databases')
+  parser.add_argument(
+    '--project-dir',
+    action='append',
+    dest='project_dirs',
+    help='dbt project dir to export; repeat to export several projects in one run'
+  )
+  parser.add_argument(
+    '--projects-config',
+    help='JSON file listing dbt projects to export, optionally with their own database names'
+  )
+  parser.add_argument(
+    '--watch',
+    action='store_true',
+    help='keep running, and sync changed records whenever dbt writes new artifacts'
+  )
+  parser.add_argument(
+    '--poll-interval',
+    type=float,
+    default=2.0,
+    help='seconds between artifact checks in watch mode'
+  )
+  parser.add_argument(
+    '--debounce',
+    type=float,
+    default=5.0,
+    help='seconds the artifacts must stay unchanged before syncing in watch mode'
+  )
+  parser.add_argument(
+    'args',
+    nargs='*',
+    help='[dbt_project_dir] all | model_name_1 model_name_2 ...'
+  )
+  return parser.parse_args(argv[1:])
+
+
+def get_projects_and_records_to_write(args, database_names):
+  if args.projects_config or args.project_dirs:
+    projects = read_projects_config(args.projects_config, database_names) if args.projects_config else []
+    for dbt_project_dir in args.project_dirs or []:
+      projects.append({
+        'project_dir': dbt_project_dir,
+        'database_names': database_names,
+      })
+    return projects, args.args
+
+  if len(args.args) > 1:
+    dbt_project_dir = args.args[0]
+    model_records_to_write = args.args[1:]
+  else:
+    dbt_project_dir = '.'
+    model_records_to_write = args.args
+    print(f'No project dir specified, defaulting to {dbt_project_dir}')
+  projects = [{
+    'project_dir': dbt_project_dir,
+    'database_names': database_names,
+  }]
+  return projects, model_records_to_write
+
+
+def main(argv=None):
+  if argv is None:
+    argv = sys.argv
+  args = parse_args(argv)
+  exporter = NotionDocsExporter.from_env()
+  projects, model_records_to_write = get_projects_and_records_to_write(
+    args, exporter.config.database_names
+  )
+  print(f'Projects to export: {[project["project_dir"] for project in projects]}')
+  print(f'Model records to write: {model_records_to_write}')
+
+  if args.watch:
+    watch(exporter, projects, model_records_to_write, args.poll_interval, args.debounce)
+    return
+
+  ###### load nodes from dbt docs ######
+  # only the compact docs are kept, the parsed artifacts are freed once they're extracted
+  sync_tasks = merge_project_docs(load_project_docs(projects))
+
+  ###### sync each resource type into its own database ######
+  results = exporter.sync(sync_tasks, model_records_to_write)
+  failed_results = [result for result in results if result.action == 'failed']
+  if failed_results:
+    print(f'\n{len(failed_results)} records failed to sync: {[result.name for result in failed_results]}')
+    return 1
+  return 0
 
 
 if __name__ == '__main__':
-  main()
+  sys.exit(main())
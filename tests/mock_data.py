@@ -86,6 +86,56 @@ DBT_MOCK_MANIFEST_MULTI = {
   },
 }
 
+DBT_MOCK_MANIFEST_RESOURCES = {
+  "nodes": {
+    "model.test.model_1": DBT_MOCK_MANIFEST["nodes"]["model.test.model_1"],
+    "seed.test.seed_1": {
+      "resource_type": "seed",
+      "columns": {},
+      "name": "seed_1",
+      "description": "Description for seed 1",
+      "relation_name": "seed.test.seed_1",
+      "tags": [],
+    },
+  },
+  "sources": {
+    "source.test.raw.table_1": {
+      "resource_type": "source",
+      "columns": {"id": {"description": "Primary key"}},
+      "source_name": "raw",
+      "name": "table_1",
+      "description": "Description for source table 1",
+      "relation_name": "raw.table_1",
+      "loader": "fivetran",
+      "tags": [],
+    },
+  },
+  "exposures": {
+    "exposure.test.dashboard_1": {
+      "resource_type": "exposure",
+      "name": "dashboard_1",
+      "description": "Description for dashboard 1",
+      "type": "dashboard",
+      "maturity": "high",
+      "url": "https://example.com/dashboard_1",
+      "owner": {"name": "Analytics", "email": "analytics@example.com"},
+      "depends_on": {"nodes": ["model.test.model_1"]},
+      "tags": [],
+    },
+  },
+}
+
+DBT_MOCK_CATALOG_RESOURCES = {
+  "nodes": DBT_MOCK_CATALOG["nodes"],
+  "sources": {
+    "source.test.raw.table_1": {
+      "columns": {"ID": {"type": "INTEGER"}},
+      "metadata": {"owner": "loader@example.com"},
+      "stats": {},
+    },
+  },
+}
+
 # Mock Notion API Responses
 NOTION_MOCK_EXISTENT_CHILD_PAGE_QUERY = {
   "results": [
@@ -102,8 +152,12 @@ NOTION_MOCK_EXISTENT_DATABASE_RECORDS_QUERY = {
   "results": [
     {
       "id": "mock_record_id",
+      "properties": {
+        "Name": {"title": [{"plain_text": "model_1"}]},
+      },
     },
   ],
+  "has_more": False,
 }
 
 NOTION_MOCK_NONEXISTENT_QUERY = {
@@ -117,3 +171,29 @@ NOTION_MOCK_DATABASE_CREATE = {
 NOTION_MOCK_RECORD_CREATE = {
   "id": "mock_record_id",
 }
+
+NOTION_MOCK_DATABASE_SCAN_FIRST_PAGE = {
+  "results": [
+    {
+      "id": "mock_record_id",
+      "properties": {
+        "Name": {"title": [{"plain_text": "model_1"}]},
+      },
+    },
+  ],
+  "has_more": True,
+  "next_cursor": "mock_cursor",
+}
+
+NOTION_MOCK_DATABASE_SCAN_SECOND_PAGE = {
+  "results": [
+    {
+      "id": "mock_orphaned_record_id",
+      "properties": {
+        "Name": {"title": [{"plain_text": "deleted_model"}]},
+      },
+    },
+  ],
+  "has_more": False,
+  "next_cursor": None,
+}
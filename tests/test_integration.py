@@ -1,15 +1,36 @@
+import copy
 import json
 import os
+import tempfile
 import unittest
 from unittest.mock import patch, Mock
 
-from dbt_docs_to_notion import get_owner, get_paths_or_empty, main
+from dbt_docs_to_notion import (
+  ExporterConfig,
+  ModelDoc,
+  NotionAPIError,
+  NotionDocsExporter,
+  RECORD_RETRY_BACKOFF,
+  RecordResult,
+  build_dependency_index,
+  build_record,
+  extract_project_docs,
+  get_digest,
+  get_owner,
+  get_paths_or_empty,
+  get_resource_database_names,
+  main,
+)
 from tests.mock_data import (
   DBT_MOCK_CATALOG,
   DBT_MOCK_CATALOG_MULTI,
+  DBT_MOCK_CATALOG_RESOURCES,
   DBT_MOCK_MANIFEST,
   DBT_MOCK_MANIFEST_MULTI,
+  DBT_MOCK_MANIFEST_RESOURCES,
   NOTION_MOCK_DATABASE_CREATE,
+  NOTION_MOCK_DATABASE_SCAN_FIRST_PAGE,
+  NOTION_MOCK_DATABASE_SCAN_SECOND_PAGE,
   NOTION_MOCK_EXISTENT_CHILD_PAGE_QUERY,
   NOTION_MOCK_EXISTENT_DATABASE_RECORDS_QUERY,
   NOTION_MOCK_NONEXISTENT_QUERY,
@@ -58,10 +79,53 @@ class TestGetOwner(unittest.TestCase):
         self.assertEqual(get_owner(data, catalog_nodes, 'model.test.m'), '')
 
 
+class TestBuildDependencyIndex(unittest.TestCase):
+
+    def _docs(self, nodes):
+        return {
+          unique_id: ModelDoc.from_node(unique_id, {'resource_type': 'model', **data}, {})
+          for unique_id, data in nodes.items()
+        }
+
+    def test_resolves_upstream_models_to_record_ids(self):
+        models = self._docs({
+          'model.p.a': {'name': 'a', 'depends_on': {'nodes': ['model.p.b', 'source.p.s.t']}},
+          'model.p.b': {'name': 'b', 'depends_on': {'nodes': []}},
+        })
+        index = build_dependency_index(models, {'a': 'id_a', 'b': 'id_b'})
+        self.assertEqual(index, {'id_a': ['id_b'], 'id_b': []})
+
+    def test_drops_upstream_models_without_records(self):
+        models = self._docs({
+          'model.p.a': {'name': 'a', 'depends_on': ['model.p.b']},
+          'model.p.b': {'name': 'b', 'depends_on': []},
+        })
+        index = build_dependency_index(models, {'a': 'id_a'})
+        self.assertEqual(index, {'id_a': []})
+
+
+class TestGetResourceDatabaseNames(unittest.TestCase):
+
+    def test_unnamed_resource_types_are_skipped(self):
+        self.assertEqual(
+          get_resource_database_names({'model': 'dbt Models', 'seed': ''}, {'source': 'dbt Sources'}),
+          {'model': 'dbt Models', 'source': 'dbt Sources'}
+        )
+
+    def test_shared_database_name_is_rejected(self):
+        with self.assertRaises(ValueError):
+          get_resource_database_names({'model': 'dbt Models', 'seed': 'dbt Models'})
+
+    def test_unknown_resource_type_is_rejected(self):
+        with self.assertRaises(ValueError):
+          get_resource_database_names({'model': 'dbt Models'}, {'metric': 'dbt Metrics'})
+
+
 class TestDbtDocsToNotionIntegration(unittest.TestCase):
 
     def setUp(self):
         patch('dbt_docs_to_notion.json.load').start().side_effect = [DBT_MOCK_MANIFEST, DBT_MOCK_CATALOG]
+        patch('dbt_docs_to_notion.orjson', None).start() # exercise the stdlib json path
         self.mock_open = patch('dbt_docs_to_notion.open', new_callable=unittest.mock.mock_open, read_data="data").start()
         self.comparison_catalog = DBT_MOCK_CATALOG['nodes']['model.test.model_1']
         self.comparison_manifest = DBT_MOCK_MANIFEST['nodes']['model.test.model_1']
@@ -123,14 +187,14 @@ class TestDbtDocsToNotionIntegration(unittest.TestCase):
       columns_table_children_obj = columns_child_block['table']['children']
       columns_table_header_row = columns_table_children_obj[0]
       self.assertEqual(columns_table_header_row['type'], 'table_row')
-      self.assertEqual(columns_table_header_row['table_row']['cells'][0][0]['plain_text'], 'Column')
-      self.assertEqual(columns_table_header_row['table_row']['cells'][1][0]['plain_text'], 'Type')
-      self.assertEqual(columns_table_header_row['table_row']['cells'][2][0]['plain_text'], 'Description')
+      self.assertEqual(columns_table_header_row['table_row']['cells'][0][0]['text']['content'], 'Column')
+      self.assertEqual(columns_table_header_row['table_row']['cells'][1][0]['text']['content'], 'Type')
+      self.assertEqual(columns_table_header_row['table_row']['cells'][2][0]['text']['content'], 'Description')
       columns_table_row = columns_table_children_obj[1]
       self.assertEqual(columns_table_row['type'], 'table_row')
-      self.assertEqual(columns_table_row['table_row']['cells'][0][0]['plain_text'], list(self.comparison_catalog['columns'].keys())[0])
-      self.assertEqual(columns_table_row['table_row']['cells'][1][0]['plain_text'], list(self.comparison_catalog['columns'].values())[0]['type'])
-      self.assertEqual(columns_table_row['table_row']['cells'][2][0]['plain_text'], list(self.comparison_manifest['columns'].values())[0]['description'])
+      self.assertEqual(columns_table_row['table_row']['cells'][0][0]['text']['content'], list(self.comparison_catalog['columns'].keys())[0])
+      self.assertEqual(columns_table_row['table_row']['cells'][1][0]['text']['content'], list(self.comparison_catalog['columns'].values())[0]['type'])
+      self.assertEqual(columns_table_row['table_row']['cells'][2][0]['text']['content'], list(self.comparison_manifest['columns'].values())[0]['description'])
       raw_code_header_child_block = record_children_obj[3]
       self.assertEqual(raw_code_header_child_block['object'], 'block')
       self.assertEqual(raw_code_header_child_block['type'], 'heading_1')
@@ -144,11 +208,15 @@ class TestDbtDocsToNotionIntegration(unittest.TestCase):
       self.assertEqual(compiled_code_header_child_block['object'], 'block')
       self.assertEqual(compiled_code_header_child_block['type'], 'heading_1')
       self.assertEqual(compiled_code_header_child_block['heading_1']['rich_text'][0]['text']['content'], 'Compiled Code')
+      # the mock model's compiled code is the same as its raw code, so it isn't uploaded twice
       compiled_code_child_block = record_children_obj[6]
       self.assertEqual(compiled_code_child_block['object'], 'block')
-      self.assertEqual(compiled_code_child_block['type'], 'code')
-      self.assertEqual(compiled_code_child_block['code']['language'], 'sql')
-      self.assertEqual(compiled_code_child_block['code']['rich_text'][0]['text']['content'], self.comparison_manifest['compiled_code'])
+      self.assertEqual(compiled_code_child_block['type'], 'paragraph')
+      self.assertEqual(compiled_code_child_block['paragraph']['rich_text'][0]['text']['content'], 'Same as the raw code.')
+      for block in record_children_obj:
+        for row in block.get('table', {}).get('children', []):
+          for cell in row['table_row']['cells']:
+            self.assertNotIn('plain_text', cell[0])
 
     @patch('dbt_docs_to_notion.make_request')
     def test_create_new_database(self, mock_make_request):
@@ -179,7 +247,6 @@ class TestDbtDocsToNotionIntegration(unittest.TestCase):
           [
             ('blocks/', 'GET'),
             ('databases/', 'POST'),
-            ('databases/', 'POST'),
             ('pages/', 'POST'),
           ]
         )
@@ -210,11 +277,47 @@ class TestDbtDocsToNotionIntegration(unittest.TestCase):
           self.recorded_requests,
           [
             ('blocks/', 'GET'),
+            ('databases/mock_child_id', 'PATCH'),
             ('databases/', 'POST'),
-            ('pages/mock_record_id', 'PATCH'),
             ('blocks/', 'GET'),
             ('blocks/', 'DELETE'),
             ('blocks/', 'PATCH'),
+            ('pages/mock_record_id', 'PATCH'),
+          ]
+        )
+
+    @patch('dbt_docs_to_notion.make_request')
+    def test_properties_only_update_when_body_unchanged(self, mock_make_request):
+        """Test that a record whose stored body digest matches gets a single
+        properties PATCH, e.g. when only catalog stats changed."""
+        doc = ModelDoc.from_node(
+          'model.test.model_1', self.comparison_manifest, DBT_MOCK_CATALOG['nodes']
+        )
+        _, record_children_obj = build_record('model', doc, 'mock_child_id')
+        existing_record = copy.deepcopy(NOTION_MOCK_EXISTENT_DATABASE_RECORDS_QUERY)
+        existing_record['results'][0]['properties']['Page Body Digest'] = {
+          'rich_text': [{'plain_text': get_digest(record_children_obj)}]
+        }
+        def _mocked_make_request(endpoint, querystring, method, **request_kwargs):
+          self.recorded_requests.append((endpoint, method))
+          if endpoint == 'blocks/' and method == 'GET':
+              return NOTION_MOCK_EXISTENT_CHILD_PAGE_QUERY
+          elif endpoint == 'databases/' and '/query' in querystring and method == 'POST':
+              return existing_record
+          elif endpoint == 'pages/' and method == 'PATCH':
+              self._verify_record_obj(request_kwargs['json'])
+          return {}
+        mock_make_request.side_effect = _mocked_make_request
+
+        main(argv=[None, 'dbt_project_dir', 'all'])
+
+        self.assertEqual(
+          self.recorded_requests,
+          [
+            ('blocks/', 'GET'),
+            ('databases/mock_child_id', 'PATCH'),
+            ('databases/', 'POST'),
+            ('pages/mock_record_id', 'PATCH'),
           ]
         )
 
@@ -245,6 +348,7 @@ class TestDbtDocsToNotionIntegration(unittest.TestCase):
         and that non-model nodes (e.g. tests) are filtered out."""
         patch.stopall()
         patch('dbt_docs_to_notion.json.load').start().side_effect = [DBT_MOCK_MANIFEST_MULTI, DBT_MOCK_CATALOG_MULTI]
+        patch('dbt_docs_to_notion.orjson', None).start()
         patch('dbt_docs_to_notion.open', new_callable=unittest.mock.mock_open, read_data="data").start()
 
         created_models = []
@@ -267,6 +371,532 @@ class TestDbtDocsToNotionIntegration(unittest.TestCase):
 
         self.assertEqual(created_models, ['model_1'])
 
+    @patch.dict(os.environ, {'PRUNE_ORPHANED_RECORDS': 'true'})
+    @patch('dbt_docs_to_notion.make_request')
+    def test_prune_orphaned_records(self, mock_make_request):
+        """Test that records for models missing from the manifest are archived
+        after a paginated scan of the database."""
+        archived_records = []
+        scan_cursors = []
+        def _mocked_make_request(endpoint, querystring, method, **request_kwargs):
+          self.recorded_requests.append((endpoint, method))
+          if endpoint == 'blocks/' and method == 'GET':
+              return NOTION_MOCK_EXISTENT_CHILD_PAGE_QUERY
+          elif endpoint == 'databases/' and 'filter' in request_kwargs['json']:
+              return NOTION_MOCK_EXISTENT_DATABASE_RECORDS_QUERY
+          elif endpoint == 'databases/' and method == 'POST':
+              scan_cursors.append(request_kwargs['json'].get('start_cursor'))
+              if 'start_cursor' in request_kwargs['json']:
+                  return NOTION_MOCK_DATABASE_SCAN_SECOND_PAGE
+              return NOTION_MOCK_DATABASE_SCAN_FIRST_PAGE
+          elif endpoint.startswith('pages/') and request_kwargs.get('json') == {'archived': True}:
+              archived_records.append(endpoint)
+          return {'results': []}
+        mock_make_request.side_effect = _mocked_make_request
+
+        main(argv=[None, 'dbt_project_dir', 'all'])
+
+        self.assertEqual(scan_cursors, [None, 'mock_cursor'])
+        self.assertEqual(archived_records, ['pages/mock_orphaned_record_id'])
+
+    @patch.dict(os.environ, {'PRUNE_ORPHANED_RECORDS': 'true', 'DEAD_LETTER_PATH': ''})
+    @patch('dbt_docs_to_notion.make_request')
+    def test_failed_archive_exits_non_zero(self, mock_make_request):
+        def _mocked_make_request(endpoint, querystring, method, **request_kwargs):
+          self.recorded_requests.append((endpoint, method))
+          if endpoint == 'blocks/' and method == 'GET':
+              return NOTION_MOCK_EXISTENT_CHILD_PAGE_QUERY
+          elif endpoint == 'databases/' and method == 'POST':
+              if 'start_cursor' in request_kwargs['json']:
+                  return NOTION_MOCK_DATABASE_SCAN_SECOND_PAGE
+              return NOTION_MOCK_DATABASE_SCAN_FIRST_PAGE
+          elif endpoint.startswith('pages/') and request_kwargs.get('json') == {'archived': True}:
+              raise NotionAPIError(503, 'Service unavailable')
+          return {'results': []}
+        mock_make_request.side_effect = _mocked_make_request
+
+        exit_code = main(argv=[None, 'dbt_project_dir', 'all'])
+
+        self.assertEqual(exit_code, 1)
+        self.assertIn(('pages/mock_record_id', 'PATCH'), self.recorded_requests)
+        self.assertEqual(self.recorded_requests[-1], ('pages/mock_orphaned_record_id', 'PATCH'))
+
+    @patch.dict(os.environ, {'PRUNE_ORPHANED_RECORDS': 'true'})
+    @patch('dbt_docs_to_notion.make_request')
+    def test_prune_skipped_for_new_database(self, mock_make_request):
+        def _mocked_make_request(endpoint, querystring, method, **request_kwargs):
+          self.recorded_requests.append((endpoint, method))
+          if endpoint == 'blocks/' and method == 'GET':
+              return NOTION_MOCK_NONEXISTENT_QUERY
+          elif endpoint == 'databases/' and querystring == '' and method == 'POST':
+              return NOTION_MOCK_DATABASE_CREATE
+          elif endpoint == 'databases/' and method == 'POST':
+              return NOTION_MOCK_NONEXISTENT_QUERY
+          elif endpoint == 'pages/' and method == 'POST':
+              return NOTION_MOCK_RECORD_CREATE
+        mock_make_request.side_effect = _mocked_make_request
+
+        main(argv=[None, 'dbt_project_dir', 'all'])
+
+        self.assertEqual(len(self.recorded_requests), 3)
+
+    @patch.dict(os.environ, {'LINK_MODEL_DEPENDENCIES': 'true'})
+    @patch('dbt_docs_to_notion.make_request')
+    def test_link_model_dependencies(self, mock_make_request):
+        """Test that relations are written in a second phase, only for records
+        whose upstream set changed."""
+        patch.stopall()
+        patch('dbt_docs_to_notion.json.load').start().side_effect = [DBT_MOCK_MANIFEST_MULTI, DBT_MOCK_CATALOG_MULTI]
+        patch('dbt_docs_to_notion.orjson', None).start()
+        patch('dbt_docs_to_notion.open', new_callable=unittest.mock.mock_open, read_data="data").start()
+
+        def _record(record_id, name, relation):
+          return {
+            'id': record_id,
+            'properties': {
+              'Name': {'title': [{'plain_text': name}]},
+              'Upstream Models': {'relation': [{'id': r} for r in relation]},
+            },
+          }
+
+        relation_updates = {}
+        def _mocked_make_request(endpoint, querystring, method, **request_kwargs):
+          self.recorded_requests.append((endpoint, method))
+          body = request_kwargs.get('json') or {}
+          if endpoint == 'blocks/' and method == 'GET' and querystring == 'mock_database_parent_id/children':
+              return NOTION_MOCK_EXISTENT_CHILD_PAGE_QUERY
+          elif endpoint == 'databases/' and 'filter' in body:
+              name = body['filter']['title']['equals']
+              return {'results': [{'id': f'id_{name}'}]}
+          elif endpoint == 'databases/' and method == 'POST':
+              return {
+                'results': [
+                  _record('id_model_1', 'model_1', []),
+                  _record('id_model_2', 'model_2', []),
+                ],
+                'has_more': False,
+              }
+          elif endpoint.startswith('pages/') and 'Upstream Models' in body.get('properties', {}):
+              relation_updates[endpoint] = body['properties']['Upstream Models']['relation']
+          return {'results': []}
+        mock_make_request.side_effect = _mocked_make_request
+
+        main(argv=[None, 'dbt_project_dir', 'all'])
+
+        self.assertIn(('databases/mock_child_id', 'PATCH'), self.recorded_requests)
+        self.assertEqual(relation_updates, {'pages/id_model_1': [{'id': 'id_model_2'}]})
+
+    @patch.dict(os.environ, {
+      'SEEDS_DATABASE_NAME': 'dbt Seeds',
+      'SOURCES_DATABASE_NAME': 'dbt Sources',
+      'EXPOSURES_DATABASE_NAME': 'dbt Exposures',
+    })
+    @patch('dbt_docs_to_notion.make_request')
+    def test_sync_multiple_resource_types(self, mock_make_request):
+        """Test that each configured resource type is routed to its own database,
+        with its own schema, from a single load of the artifacts."""
+        patch.stopall()
+        mock_json_load = patch('dbt_docs_to_notion.json.load').start()
+        patch('dbt_docs_to_notion.orjson', None).start()
+        mock_json_load.side_effect = [DBT_MOCK_MANIFEST_RESOURCES, DBT_MOCK_CATALOG_RESOURCES]
+        patch('dbt_docs_to_notion.open', new_callable=unittest.mock.mock_open, read_data="data").start()
+
+        created_databases = {}
+        created_records = {}
+        def _mocked_make_request(endpoint, querystring, method, **request_kwargs):
+          self.recorded_requests.append((endpoint, method))
+          if endpoint == 'blocks/' and method == 'GET':
+              return NOTION_MOCK_NONEXISTENT_QUERY
+          elif endpoint == 'databases/' and querystring == '' and method == 'POST':
+              database_obj = request_kwargs['json']
+              title = database_obj['title'][0]['text']['content']
+              created_databases[title] = database_obj['properties']
+              return {'id': f'id_{title}'}
+          elif endpoint == 'pages/' and method == 'POST':
+              record_obj = request_kwargs['json']
+              name = record_obj['properties']['Name']['title'][0]['text']['content']
+              created_records[name] = record_obj
+              return NOTION_MOCK_RECORD_CREATE
+        mock_make_request.side_effect = _mocked_make_request
+
+        main(argv=[None, 'dbt_project_dir', 'all'])
+
+        self.assertEqual(mock_json_load.call_count, 2)
+        self.assertEqual(self.recorded_requests.count(('blocks/', 'GET')), 1)
+        self.assertEqual(
+          set(created_databases),
+          {os.environ['DATABASE_NAME'], 'dbt Seeds', 'dbt Sources', 'dbt Exposures'}
+        )
+        self.assertIn('Loader', created_databases['dbt Sources'])
+        self.assertIn('Maturity', created_databases['dbt Exposures'])
+        self.assertNotIn('Depends On', created_databases['dbt Seeds'])
+        self.assertEqual(
+          {name: record['parent']['database_id'] for name, record in created_records.items()},
+          {
+            'model_1': f"id_{os.environ['DATABASE_NAME']}",
+            'seed_1': 'id_dbt Seeds',
+            'raw.table_1': 'id_dbt Sources',
+            'dashboard_1': 'id_dbt Exposures',
+          }
+        )
+        source_record = created_records['raw.table_1']
+        self.assertEqual(source_record['properties']['Loader']['rich_text'][0]['text']['content'], 'fivetran')
+        source_columns_row = source_record['children'][2]['table']['children'][1]
+        self.assertEqual(source_columns_row['table_row']['cells'][2][0]['text']['content'], 'Primary key')
+        exposure_record = created_records['dashboard_1']
+        self.assertEqual(exposure_record['properties']['URL'], {'url': 'https://example.com/dashboard_1'})
+        self.assertEqual(exposure_record['properties']['Type'], {'select': {'name': 'dashboard'}})
+
+    @patch.dict(os.environ, {'DEAD_LETTER_PATH': ''})
+    @patch('dbt_docs_to_notion.make_request')
+    def test_failed_records_exit_non_zero(self, mock_make_request):
+        patch.stopall()
+        patch('dbt_docs_to_notion.json.load').start().side_effect = [DBT_MOCK_MANIFEST_MULTI, DBT_MOCK_CATALOG_MULTI]
+        patch('dbt_docs_to_notion.orjson', None).start()
+        patch('dbt_docs_to_notion.open', new_callable=unittest.mock.mock_open, read_data="data").start()
+
+        created_models = []
+        def _mocked_make_request(endpoint, querystring, method, **request_kwargs):
+          if endpoint == 'blocks/' and method == 'GET':
+              return NOTION_MOCK_NONEXISTENT_QUERY
+          elif endpoint == 'databases/' and querystring == '' and method == 'POST':
+              return NOTION_MOCK_DATABASE_CREATE
+          elif endpoint == 'pages/' and method == 'POST':
+              name = request_kwargs['json']['properties']['Name']['title'][0]['text']['content']
+              if name == 'model_2':
+                  raise NotionAPIError(400, 'Bad payload')
+              created_models.append(name)
+              return NOTION_MOCK_RECORD_CREATE
+        mock_make_request.side_effect = _mocked_make_request
+
+        exit_code = main(argv=[None, 'dbt_project_dir', 'all'])
+
+        self.assertEqual(exit_code, 1)
+        self.assertEqual(created_models, ['model_1'])
+
+    @patch('dbt_docs_to_notion.make_request')
+    def test_multiple_projects_in_one_run(self, mock_make_request):
+        """Test that several projects are synced in one process, looking up the
+        parent page once."""
+        project = {'database_names': {'model': os.environ['DATABASE_NAME']}}
+        mock_load_project_docs = patch('dbt_docs_to_notion.load_project_docs').start()
+        mock_load_project_docs.return_value = [
+          extract_project_docs(project, DBT_MOCK_MANIFEST, DBT_MOCK_CATALOG),
+          extract_project_docs(project, DBT_MOCK_MANIFEST_MULTI, DBT_MOCK_CATALOG_MULTI),
+        ]
+
+        created_models = []
+        def _mocked_make_request(endpoint, querystring, method, **request_kwargs):
+          self.recorded_requests.append((endpoint, method))
+          if endpoint == 'blocks/' and method == 'GET':
+              return NOTION_MOCK_NONEXISTENT_QUERY
+          elif endpoint == 'databases/' and querystring == '' and method == 'POST':
+              return NOTION_MOCK_DATABASE_CREATE
+          elif endpoint == 'pages/' and method == 'POST':
+              created_models.append(request_kwargs['json']['properties']['Name']['title'][0]['text']['content'])
+              return NOTION_MOCK_RECORD_CREATE
+        mock_make_request.side_effect = _mocked_make_request
+
+        main(argv=[None, '--project-dir', 'project_a', '--project-dir', 'project_b', 'all'])
+
+        mock_load_project_docs.assert_called_once()
+        self.assertEqual(
+          [project['project_dir'] for project in mock_load_project_docs.call_args.args[0]],
+          ['project_a', 'project_b']
+        )
+        self.assertEqual(self.recorded_requests.count(('blocks/', 'GET')), 1)
+        self.assertEqual(self.recorded_requests.count(('databases/', 'POST')), 1)
+        self.assertEqual(sorted(created_models), ['model_1', 'model_2'])
+
+    @patch('dbt_docs_to_notion.time.sleep')
+    @patch('dbt_docs_to_notion.make_request')
+    def test_watch_syncs_only_changed_records(self, mock_make_request, _mock_sleep):
+        """Test that watch mode keeps the database id and page index warm, waits
+        for the artifacts to settle, then only writes records that changed."""
+        changed_manifest = copy.deepcopy(DBT_MOCK_MANIFEST_MULTI)
+        changed_manifest['nodes']['model.test.model_2']['description'] = 'New description'
+        mock_load_artifacts = patch('dbt_docs_to_notion.load_artifacts').start()
+        mock_load_artifacts.side_effect = [
+          (DBT_MOCK_MANIFEST_MULTI, DBT_MOCK_CATALOG_MULTI),
+          (changed_manifest, DBT_MOCK_CATALOG_MULTI),
+        ]
+        patch('dbt_docs_to_notion.get_artifact_mtimes').start().side_effect = [
+          (1, 1), # initial sync
+          (2, 1), # dbt starts writing
+          (2, 2), # still writing
+          (2, 2), # settled
+          (2, 2),
+          KeyboardInterrupt,
+        ]
+
+        def _mocked_make_request(endpoint, querystring, method, **request_kwargs):
+          self.recorded_requests.append((endpoint, method))
+          if endpoint == 'blocks/' and method == 'GET' and querystring == 'mock_database_parent_id/children':
+              return NOTION_MOCK_NONEXISTENT_QUERY
+          elif endpoint == 'databases/' and querystring == '' and method == 'POST':
+              return NOTION_MOCK_DATABASE_CREATE
+          elif endpoint == 'pages/' and method == 'POST':
+              name = request_kwargs['json']['properties']['Name']['title'][0]['text']['content']
+              return {'id': f'id_{name}'}
+          return {'results': []}
+        mock_make_request.side_effect = _mocked_make_request
+
+        main(argv=[None, 'dbt_project_dir', 'all', '--watch', '--debounce', '0'])
+
+        self.assertEqual(mock_load_artifacts.call_count, 2)
+        self.assertEqual(self.recorded_requests.count(('blocks/', 'GET')), 1) # parent page only
+        self.assertEqual(self.recorded_requests.count(('databases/', 'POST')), 1)
+        self.assertEqual(self.recorded_requests.count(('pages/', 'POST')), 2)
+        # only model_2's description changed, so its body is left alone
+        self.assertEqual(self.recorded_requests[-1:], [('pages/id_model_2', 'PATCH')])
+
+
+    @patch('dbt_docs_to_notion.time.sleep')
+    @patch('dbt_docs_to_notion.make_request')
+    def test_watch_survives_projects_that_cant_be_merged(self, mock_make_request, _mock_sleep):
+        mock_load_artifacts = patch('dbt_docs_to_notion.load_artifacts').start()
+        mock_load_artifacts.return_value = (DBT_MOCK_MANIFEST_MULTI, DBT_MOCK_CATALOG_MULTI)
+        patch('dbt_docs_to_notion.merge_project_docs').start().side_effect = [
+          {},
+          ValueError('Database dbt Models would have several records named model_1'),
+          {},
+        ]
+        mock_sync = patch('dbt_docs_to_notion.NotionDocsExporter.sync').start()
+        patch('dbt_docs_to_notion.get_artifact_mtimes').start().side_effect = [
+          (1, 1), # initial sync
+          (2, 2), # a clashing model is added
+          (2, 2), # settled, can't be merged
+          (3, 3), # the clash is fixed
+          (3, 3), # settled
+          KeyboardInterrupt,
+        ]
+
+        main(argv=[None, 'dbt_project_dir', 'all', '--watch', '--debounce', '0'])
+
+        self.assertEqual(mock_load_artifacts.call_count, 3)
+        self.assertEqual(mock_sync.call_count, 2)
+
+
+class TestNotionDocsExporter(unittest.TestCase):
+
+    def setUp(self):
+        self.config = ExporterConfig(
+          notion_token='explicit_token',
+          database_parent_id='explicit_parent_id',
+          database_names={'model': 'dbt Models', 'seed': ''},
+        )
+        self.recorded_requests = []
+
+    def _mocked_make_request(self, endpoint, querystring, method, **request_kwargs):
+        self.recorded_requests.append((endpoint, querystring, method))
+        if endpoint == 'blocks/' and method == 'GET':
+            return NOTION_MOCK_NONEXISTENT_QUERY
+        elif endpoint == 'databases/' and querystring == '' and method == 'POST':
+            return NOTION_MOCK_DATABASE_CREATE
+        elif endpoint == 'pages/' and method == 'POST':
+            name = request_kwargs['json']['properties']['Name']['title'][0]['text']['content']
+            return {'id': f'id_{name}'}
+        return {'results': []}
+
+    @patch.dict(os.environ, {}, clear=True)
+    @patch('dbt_docs_to_notion.make_request')
+    def test_exports_in_memory_artifacts_without_environment(self, mock_make_request):
+        mock_make_request.side_effect = self._mocked_make_request
+        exporter = NotionDocsExporter(self.config)
+
+        results = exporter.export(DBT_MOCK_MANIFEST_MULTI, DBT_MOCK_CATALOG_MULTI)
+
+        self.assertEqual(sorted(results, key=lambda result: result.name), [
+          RecordResult('model', 'model.test.model_1', 'model_1', 'created', 'id_model_1'),
+          RecordResult('model', 'model.test.model_2', 'model_2', 'created', 'id_model_2'),
+        ])
+        self.assertEqual(self.recorded_requests[0], ('blocks/', 'explicit_parent_id/children', 'GET'))
+        self.assertTrue(all(
+          call.kwargs['client'] is exporter.client for call in mock_make_request.call_args_list
+        ))
+
+    @patch('dbt_docs_to_notion.make_request')
+    def test_reused_exporter_only_writes_changed_records(self, mock_make_request):
+        mock_make_request.side_effect = self._mocked_make_request
+        exporter = NotionDocsExporter(self.config)
+        exporter.export(DBT_MOCK_MANIFEST_MULTI, DBT_MOCK_CATALOG_MULTI)
+        self.recorded_requests.clear()
+
+        changed_manifest = copy.deepcopy(DBT_MOCK_MANIFEST_MULTI)
+        changed_manifest['nodes']['model.test.model_1']['description'] = 'New description'
+        changed_manifest['nodes']['model.test.model_2']['raw_code'] = 'SELECT 3'
+        results = exporter.export(changed_manifest, DBT_MOCK_CATALOG_MULTI)
+
+        self.assertEqual(
+          {result.name: result.action for result in results},
+          {'model_1': 'properties_updated', 'model_2': 'updated'}
+        )
+        self.assertEqual(
+          sorted(self.recorded_requests),
+          [('blocks/', 'id_model_2/children', 'GET'), ('blocks/', 'id_model_2/children', 'PATCH'),
+           ('pages/id_model_1', '', 'PATCH'), ('pages/id_model_2', '', 'PATCH')]
+        )
+
+    @patch('dbt_docs_to_notion.time.sleep')
+    @patch('dbt_docs_to_notion.make_request')
+    def test_failed_records_are_isolated_retried_and_dead_lettered(self, mock_make_request, mock_sleep):
+        dead_letter_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(dead_letter_dir.cleanup)
+        self.config.dead_letter_path = os.path.join(dead_letter_dir.name, 'dead_letters.json')
+        record_creation_attempts = []
+        def _mocked_make_request(endpoint, querystring, method, **request_kwargs):
+          if endpoint == 'pages/' and method == 'POST':
+              name = request_kwargs['json']['properties']['Name']['title'][0]['text']['content']
+              record_creation_attempts.append(name)
+              if name == 'model_1':
+                  raise NotionAPIError(400, 'Title is too long', 'POST', 'https://api.notion.com/v1/pages/', request_kwargs['json'])
+              if record_creation_attempts.count(name) == 1:
+                  raise NotionAPIError(503, 'Service unavailable', 'POST', 'https://api.notion.com/v1/pages/')
+          return self._mocked_make_request(endpoint, querystring, method, **request_kwargs)
+        mock_make_request.side_effect = _mocked_make_request
+
+        results = NotionDocsExporter(self.config).export(DBT_MOCK_MANIFEST_MULTI, DBT_MOCK_CATALOG_MULTI)
+
+        self.assertEqual(
+          {result.name: result.action for result in results},
+          {'model_1': 'failed', 'model_2': 'created'}
+        )
+        self.assertEqual(sorted(record_creation_attempts), ['model_1', 'model_2', 'model_2'])
+        mock_sleep.assert_called_once_with(RECORD_RETRY_BACKOFF)
+        with open(self.config.dead_letter_path) as f:
+            dead_letters = json.load(f)
+        self.assertEqual(len(dead_letters), 1)
+        self.assertEqual(dead_letters[0]['unique_id'], 'model.test.model_1')
+        self.assertEqual(dead_letters[0]['request']['method'], 'POST')
+        self.assertEqual(dead_letters[0]['request']['body']['properties']['Name']['title'][0]['text']['content'], 'model_1')
+        self.assertEqual(dead_letters[0]['response'], {'status_code': 400, 'text': 'Title is too long'})
+
+        mock_make_request.side_effect = self._mocked_make_request
+        NotionDocsExporter(self.config).export(DBT_MOCK_MANIFEST_MULTI, DBT_MOCK_CATALOG_MULTI)
+        with open(self.config.dead_letter_path) as f:
+            self.assertEqual(json.load(f), [])
+
+    @patch('dbt_docs_to_notion.time.sleep')
+    @patch('dbt_docs_to_notion.make_request')
+    def test_retried_creation_looks_the_title_up_again(self, mock_make_request, _mock_sleep):
+        created_records = []
+        def _mocked_make_request(endpoint, querystring, method, **request_kwargs):
+          if endpoint == 'pages/' and method == 'POST':
+              name = request_kwargs['json']['properties']['Name']['title'][0]['text']['content']
+              created_records.append(name)
+              if name == 'model_1':
+                  raise NotionAPIError(504, 'Gateway timeout') # the page was created nonetheless
+          elif endpoint == 'databases/' and 'filter' in request_kwargs['json']:
+              if request_kwargs['json']['filter']['title']['equals'] in created_records:
+                  return {'results': [{'id': 'id_model_1', 'properties': {}}]}
+          return self._mocked_make_request(endpoint, querystring, method, **request_kwargs)
+        mock_make_request.side_effect = _mocked_make_request
+
+        results = NotionDocsExporter(self.config).export(DBT_MOCK_MANIFEST_MULTI, DBT_MOCK_CATALOG_MULTI)
+
+        self.assertEqual(sorted(created_records), ['model_1', 'model_2'])
+        self.assertEqual(
+          {result.name: (result.action, result.record_id) for result in results},
+          {'model_1': ('updated', 'id_model_1'), 'model_2': ('created', 'id_model_2')}
+        )
+
+    @patch('dbt_docs_to_notion.make_request')
+    def test_failed_relation_update_is_isolated(self, mock_make_request):
+        self.config.link_model_dependencies = True
+        def _mocked_make_request(endpoint, querystring, method, **request_kwargs):
+          if 'Upstream Models' in (request_kwargs.get('json') or {}).get('properties', {}):
+              if endpoint.startswith('pages/'):
+                  raise NotionAPIError(400, 'Invalid relation')
+          return self._mocked_make_request(endpoint, querystring, method, **request_kwargs)
+        mock_make_request.side_effect = _mocked_make_request
+        exporter = NotionDocsExporter(self.config)
+
+        results = exporter.export(DBT_MOCK_MANIFEST_MULTI, DBT_MOCK_CATALOG_MULTI)
+
+        self.assertEqual(
+          {result.name: result.action for result in results},
+          {'model_1': 'failed', 'model_2': 'created'}
+        )
+        self.assertNotIn('model_1', exporter.states[('model', 'dbt Models')].record_digests)
+
+    @patch('dbt_docs_to_notion.make_request')
+    def test_unchanged_record_is_linked_to_later_created_upstream_record(self, mock_make_request):
+        self.config.link_model_dependencies = True
+        failing_records = {'model_2'}
+        relation_updates = {}
+        def _mocked_make_request(endpoint, querystring, method, **request_kwargs):
+          body = request_kwargs.get('json') or {}
+          if endpoint == 'pages/' and method == 'POST':
+              if body['properties']['Name']['title'][0]['text']['content'] in failing_records:
+                  raise NotionAPIError(400, 'Bad payload')
+          elif 'Upstream Models' in body.get('properties', {}) and endpoint.startswith('pages/'):
+              relation_updates[endpoint] = body['properties']['Upstream Models']['relation']
+          return self._mocked_make_request(endpoint, querystring, method, **request_kwargs)
+        mock_make_request.side_effect = _mocked_make_request
+        exporter = NotionDocsExporter(self.config)
+        exporter.export(DBT_MOCK_MANIFEST_MULTI, DBT_MOCK_CATALOG_MULTI)
+        self.assertEqual(relation_updates, {})
+
+        failing_records.clear()
+        results = exporter.export(DBT_MOCK_MANIFEST_MULTI, DBT_MOCK_CATALOG_MULTI)
+
+        self.assertEqual(
+          {result.name: result.action for result in results},
+          {'model_1': 'unchanged', 'model_2': 'created'}
+        )
+        self.assertEqual(relation_updates, {'pages/id_model_1': [{'id': 'id_model_2'}]})
+
+    @patch('dbt_docs_to_notion.make_request')
+    def test_failed_database_does_not_discard_other_databases(self, mock_make_request):
+        self.config.database_names = {'model': 'dbt Models', 'seed': 'dbt Seeds'}
+        def _mocked_make_request(endpoint, querystring, method, **request_kwargs):
+          if endpoint == 'databases/' and querystring == '' and method == 'POST':
+              if request_kwargs['json']['title'][0]['text']['content'] == 'dbt Seeds':
+                  raise NotionAPIError(400, 'Invalid database schema')
+          return self._mocked_make_request(endpoint, querystring, method, **request_kwargs)
+        mock_make_request.side_effect = _mocked_make_request
+        exporter = NotionDocsExporter(self.config)
+
+        results = exporter.export(DBT_MOCK_MANIFEST_RESOURCES, DBT_MOCK_CATALOG_RESOURCES)
+
+        self.assertEqual(
+          {result.name: result.action for result in results},
+          {'model_1': 'created', 'seed_1': 'failed'}
+        )
+        self.assertEqual(exporter.states[('seed', 'dbt Seeds')].database_id, '')
+
+    def test_config_from_env(self):
+        config = ExporterConfig.from_env({
+          'NOTION_TOKEN': 'env_token',
+          'DATABASE_PARENT_ID': 'env_parent_id',
+          'DATABASE_NAME': 'dbt Models',
+          'SOURCES_DATABASE_NAME': 'dbt Sources',
+          'PRUNE_ORPHANED_RECORDS': 'True',
+          'PAGE_SECTIONS': 'columns, raw_code',
+          'DATABASE_ID': 'env_database_id',
+        })
+        self.assertEqual(config.database_names, {'model': 'dbt Models', 'source': 'dbt Sources'})
+        self.assertEqual(config.database_ids, {'dbt Models': 'env_database_id'})
+        self.assertTrue(config.prune_orphaned_records)
+        self.assertFalse(config.link_model_dependencies)
+        self.assertEqual(config.page_sections, {'columns', 'raw_code'})
+
+    def test_unknown_page_sections_are_rejected(self):
+        with self.assertRaisesRegex(ValueError, 'compiled_sql'):
+            ExporterConfig(
+              notion_token='explicit_token',
+              database_parent_id='explicit_parent_id',
+              database_names={'model': 'dbt Models'},
+              page_sections={'columns', 'compiled_sql'},
+            )
+        with self.assertRaises(ValueError):
+            ExporterConfig.from_env({
+              'NOTION_TOKEN': 'env_token',
+              'DATABASE_PARENT_ID': 'env_parent_id',
+              'DATABASE_NAME': 'dbt Models',
+              'PAGE_SECTIONS': 'columns,raw-code',
+            })
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,31 +1,183 @@
+import copy
+import json
+import os
+import tempfile
+import time
 import unittest
 from unittest.mock import patch, Mock
 
-from dbt_docs_to_notion import make_request, get_paths_or_empty, get_owner
-from tests.mock_data import DBT_MOCK_MANIFEST, DBT_MOCK_CATALOG, NOTION_MOCK_DATABASE_CREATE
+import requests
+
+import dbt_docs_to_notion
+from dbt_docs_to_notion import (
+  AdaptiveRateController,
+  COMPILED_CODE_SAME_AS_RAW_BLOCK,
+  ColumnDoc,
+  DatabaseDirectory,
+  ExposureDoc,
+  ModelDoc,
+  NotionAPIError,
+  NotionClient,
+  PAGE_SECTIONS,
+  REQUEST_TIMEOUT,
+  build_record,
+  code_block,
+  encode_json,
+  extract_project_docs,
+  get_bytes_saved,
+  load_json_artifact,
+  make_request,
+  get_paths_or_empty,
+  get_owner,
+  group_sync_tasks,
+  load_project_docs,
+  read_projects_config,
+  render_columns_table,
+)
+from tests.mock_data import (
+  DBT_MOCK_MANIFEST,
+  DBT_MOCK_MANIFEST_MULTI,
+  DBT_MOCK_MANIFEST_RESOURCES,
+  DBT_MOCK_CATALOG,
+  DBT_MOCK_CATALOG_MULTI,
+  NOTION_MOCK_DATABASE_CREATE,
+)
 
 
 class TestMakeRequest(unittest.TestCase):
-    @patch('dbt_docs_to_notion.requests.request')
-    def test_valid_request(self, mock_request):
-        mock_request.return_value = Mock(status_code=200, json=lambda: NOTION_MOCK_DATABASE_CREATE)
-        response = make_request("some_endpoint")
+    def setUp(self):
+        self.client = NotionClient('mock_notion_token')
+        self.mock_request = patch.object(self.client.session, 'request').start()
+        self.mock_sleep = patch('dbt_docs_to_notion.time.sleep').start()
+
+    def tearDown(self):
+        patch.stopall()
+
+    def test_valid_request(self):
+        self.mock_request.return_value = Mock(status_code=200, json=lambda: NOTION_MOCK_DATABASE_CREATE)
+        response = make_request("some_endpoint", client=self.client)
         self.assertEqual(response, NOTION_MOCK_DATABASE_CREATE)
 
-    @patch('dbt_docs_to_notion.requests.request')
-    def test_invalid_token(self, mock_request):
-        mock_request.return_value = Mock(status_code=403, json=lambda: {"message": "Invalid token"})
+    def test_invalid_token(self):
+        self.mock_request.return_value = Mock(status_code=403, json=lambda: {"message": "Invalid token"})
         with self.assertRaises(Exception) as context:
-            make_request("some_endpoint")
+            make_request("some_endpoint", client=self.client)
         self.assertIn("Request returned status code 403", str(context.exception))
 
-    @patch('dbt_docs_to_notion.requests.request')
-    def test_error_response(self, mock_request):
-        mock_request.return_value = Mock(status_code=500, json=lambda: {"message": "Server error"})
+    def test_error_response(self):
+        self.mock_request.return_value = Mock(status_code=500, json=lambda: {"message": "Server error"})
         with self.assertRaises(Exception) as context:
-            make_request("some_endpoint")
+            make_request("some_endpoint", client=self.client)
         self.assertIn("Request returned status code 500", str(context.exception))
 
+    def test_retries_server_errors(self):
+        self.mock_request.side_effect = [
+            Mock(status_code=502, text='Bad gateway'),
+            Mock(status_code=200, json=lambda: NOTION_MOCK_DATABASE_CREATE),
+        ]
+        self.assertEqual(make_request("some_endpoint", client=self.client), NOTION_MOCK_DATABASE_CREATE)
+        self.assertEqual(self.mock_request.call_count, 2)
+
+    def test_retries_rate_limited_requests(self):
+        self.mock_request.side_effect = [
+            Mock(status_code=429, text='Rate limited', headers={'Retry-After': '2'}),
+            Mock(status_code=200, json=lambda: NOTION_MOCK_DATABASE_CREATE),
+        ]
+        self.assertEqual(make_request("some_endpoint", client=self.client), NOTION_MOCK_DATABASE_CREATE)
+        self.assertGreaterEqual(self.mock_sleep.call_args[0][0], 1.9)
+
+    def test_creations_are_only_retried_when_rate_limited(self):
+        self.mock_request.side_effect = [
+            Mock(status_code=429, text='Rate limited', headers={}),
+            Mock(status_code=502, text='Bad gateway'),
+        ]
+        with self.assertRaises(NotionAPIError) as context:
+            make_request("pages/", client=self.client, method='POST', json={})
+        self.assertEqual(context.exception.status_code, 502)
+        self.assertEqual(self.mock_request.call_count, 2)
+
+    def test_queries_are_retried_on_server_errors(self):
+        self.mock_request.side_effect = [
+            Mock(status_code=502, text='Bad gateway'),
+            Mock(status_code=200, json=lambda: NOTION_MOCK_DATABASE_CREATE),
+        ]
+        response = make_request("databases/", "some_id/query", 'POST', client=self.client, json={})
+        self.assertEqual(response, NOTION_MOCK_DATABASE_CREATE)
+
+    def test_json_body_is_encoded_compactly(self):
+        self.mock_request.return_value = Mock(status_code=200, json=lambda: {})
+        make_request("some_endpoint", client=self.client, method='POST', json={'a': [1, 2]})
+        self.assertEqual(self.mock_request.call_args.kwargs['data'], b'{"a":[1,2]}')
+        self.assertNotIn('json', self.mock_request.call_args.kwargs)
+
+    def test_requests_time_out(self):
+        self.mock_request.return_value = Mock(status_code=200, json=lambda: {})
+        make_request("some_endpoint", client=self.client)
+        self.assertEqual(self.mock_request.call_args.kwargs['timeout'], REQUEST_TIMEOUT)
+
+    def test_unexpected_errors_free_their_request_slot(self):
+        controller = AdaptiveRateController(requests_per_second=100.0, concurrency=1)
+        self.client.request_controller = controller
+        self.mock_request.side_effect = [
+            requests.exceptions.ChunkedEncodingError('Connection broken'),
+            Mock(status_code=200, json=lambda: NOTION_MOCK_DATABASE_CREATE),
+        ]
+        with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+            make_request("some_endpoint", client=self.client)
+        self.assertEqual(controller.in_flight, 0)
+        self.assertEqual(controller.consecutive_server_errors, 1)
+        self.assertEqual(make_request("some_endpoint", client=self.client), NOTION_MOCK_DATABASE_CREATE)
+
+    def test_client_errors_are_not_retried(self):
+        self.mock_request.return_value = Mock(status_code=400, text='Bad request')
+        with self.assertRaises(NotionAPIError) as context:
+            make_request("some_endpoint", client=self.client)
+        self.assertEqual(context.exception.status_code, 400)
+        self.assertEqual(self.mock_request.call_count, 1)
+
+    def test_errors_carry_the_failing_request(self):
+        self.mock_request.return_value = Mock(status_code=400, text='Bad request')
+        with self.assertRaises(NotionAPIError) as context:
+            make_request("pages/", client=self.client, method='POST', json={'a': 1})
+        self.assertEqual(context.exception.method, 'POST')
+        self.assertEqual(context.exception.url, 'https://api.notion.com/v1/pages/')
+        self.assertEqual(context.exception.request_body, {'a': 1})
+
+
+class TestAdaptiveRateController(unittest.TestCase):
+    def test_fast_successes_increase_rate_and_concurrency(self):
+        controller = AdaptiveRateController(requests_per_second=1.0, concurrency=1)
+        for _ in range(10):
+            controller.in_flight += 1
+            controller.release(200, latency=0.1)
+        self.assertGreater(controller.requests_per_second, 1.0)
+        self.assertGreater(controller.concurrency, 1)
+        self.assertLessEqual(controller.concurrency, controller.max_concurrency)
+
+    def test_rate_limit_halves_rate_and_pauses_requests(self):
+        controller = AdaptiveRateController(requests_per_second=2.0, concurrency=4)
+        controller.in_flight += 1
+        controller.release(429, latency=0.1, retry_after=5)
+        self.assertEqual(controller.requests_per_second, 1.0)
+        self.assertEqual(controller.concurrency, 2)
+        self.assertGreater(controller.next_request_time - time.monotonic(), 4)
+
+    def test_slow_responses_reduce_concurrency(self):
+        controller = AdaptiveRateController(concurrency=4, target_latency=1.0)
+        controller.in_flight += 1
+        controller.release(200, latency=3.0)
+        self.assertLess(controller.concurrency, 4)
+
+    def test_sustained_server_errors_open_circuit(self):
+        controller = AdaptiveRateController(circuit_breaker_threshold=3, circuit_breaker_cooldown=60)
+        for _ in range(2):
+            controller.in_flight += 1
+            controller.release(503, latency=0.1)
+        self.assertLess(controller.next_request_time - time.monotonic(), 60)
+        controller.in_flight += 1
+        controller.release(503, latency=0.1)
+        self.assertGreater(controller.next_request_time - time.monotonic(), 59)
+
 
 class TestGetPathsOrEmpty(unittest.TestCase):
     def test_valid_path(self):
@@ -45,5 +197,315 @@ class TestGetOwner(unittest.TestCase):
         self.assertEqual(result, "owner@example.com")
 
 
+class TestModelDoc(unittest.TestCase):
+    def test_from_node(self):
+        doc = ModelDoc.from_node(
+            'model.test.model_1',
+            DBT_MOCK_MANIFEST['nodes']['model.test.model_1'],
+            DBT_MOCK_CATALOG['nodes']
+        )
+        self.assertEqual(doc.name, 'model_1')
+        self.assertEqual(doc.owner, 'owner@example.com')
+        self.assertEqual(doc.approx_rows, 1)
+        self.assertEqual(doc.approx_gb, 0.001)
+        self.assertEqual(doc.depends_on_nodes, ('model.test.model_2',))
+        self.assertEqual(doc.columns, (
+            ColumnDoc('column_1', 'TEXT', 'Description for column 1'),
+            ColumnDoc('column_2', 'TEXT', 'Description for column 2'),
+        ))
+        self.assertFalse(doc.columns_truncated)
+
+    def test_columns_are_truncated(self):
+        catalog_nodes = {'model.test.wide': {'columns': {f'c{i}': {'type': 'INT'} for i in range(120)}}}
+        doc = ModelDoc.from_node(
+            'model.test.wide',
+            {'resource_type': 'model', 'name': 'wide', 'columns': {}},
+            catalog_nodes
+        )
+        self.assertEqual(len(doc.columns), 98)
+        self.assertTrue(doc.columns_truncated)
+
+        table_rows = render_columns_table(doc)['table']['children']
+        self.assertEqual(len(table_rows), 100) # notion api limit
+        self.assertEqual(table_rows[-1]['table_row']['cells'][0][0]['text']['content'], '...')
+
+    def test_source_name_includes_source(self):
+        source = DBT_MOCK_MANIFEST_RESOURCES['sources']['source.test.raw.table_1']
+        doc = ModelDoc.from_node('source.test.raw.table_1', source, {})
+        self.assertEqual(doc.name, 'raw.table_1')
+        self.assertEqual(doc.loader, 'fivetran')
+
+
+class TestBuildRecord(unittest.TestCase):
+    def test_model_record(self):
+        doc = ModelDoc.from_node(
+            'model.test.model_1',
+            DBT_MOCK_MANIFEST['nodes']['model.test.model_1'],
+            DBT_MOCK_CATALOG['nodes']
+        )
+        record_obj, record_children_obj = build_record('model', doc, 'mock_database_id')
+        self.assertEqual(record_obj['parent'], {'database_id': 'mock_database_id'})
+        self.assertEqual(
+            record_obj['properties']['Depends On']['rich_text'][0]['text']['content'],
+            json.dumps(['model.test.model_2'])
+        )
+        self.assertEqual(
+            [block['type'] for block in record_children_obj],
+            ['table_of_contents', 'heading_1', 'table', 'heading_1', 'code', 'heading_1', 'paragraph']
+        )
+
+    def test_compiled_code_is_uploaded_when_it_differs(self):
+        data = dict(DBT_MOCK_MANIFEST['nodes']['model.test.model_1'], compiled_code='SELECT 1 AS one')
+        doc = ModelDoc.from_node('model.test.model_1', data, DBT_MOCK_CATALOG['nodes'])
+        _, record_children_obj = build_record('model', doc, 'mock_database_id')
+        self.assertEqual(record_children_obj[-1]['code']['rich_text'][0]['text']['content'], 'SELECT 1 AS one')
+        self.assertEqual(
+            get_bytes_saved('model', doc, PAGE_SECTIONS),
+            get_bytes_saved('seed', doc, PAGE_SECTIONS)
+        )
+
+    def test_sections_are_configurable(self):
+        doc = ModelDoc.from_node(
+            'model.test.model_1',
+            DBT_MOCK_MANIFEST['nodes']['model.test.model_1'],
+            DBT_MOCK_CATALOG['nodes']
+        )
+        _, record_children_obj = build_record('model', doc, 'mock_database_id', {'compiled_code'})
+        self.assertEqual(
+            [block['type'] for block in record_children_obj],
+            ['table_of_contents', 'heading_1', 'code']
+        )
+
+    def test_bytes_saved_match_dropped_fields(self):
+        doc = ModelDoc.from_node(
+            'model.test.model_1',
+            DBT_MOCK_MANIFEST['nodes']['model.test.model_1'],
+            DBT_MOCK_CATALOG['nodes']
+        )
+        _, record_children_obj = build_record('model', doc, 'mock_database_id')
+        unminimized = copy.deepcopy(record_children_obj)
+        for row in unminimized[2]['table']['children']:
+            for cell in row['table_row']['cells']:
+                cell[0]['plain_text'] = cell[0]['text']['content']
+        unminimized[6] = code_block(doc.compiled_code)
+        self.assertEqual(
+            get_bytes_saved('model', doc, PAGE_SECTIONS),
+            len(encode_json(unminimized)) - len(encode_json(record_children_obj))
+        )
+
+    def test_bytes_saved_without_columns_count_the_collapsed_compiled_code(self):
+        doc = ModelDoc.from_node(
+            'model.test.model_1',
+            DBT_MOCK_MANIFEST['nodes']['model.test.model_1'],
+            DBT_MOCK_CATALOG['nodes']
+        )
+        page_sections = {'raw_code', 'compiled_code'}
+        _, record_children_obj = build_record('model', doc, 'mock_database_id', page_sections)
+        self.assertEqual(record_children_obj[-1], COMPILED_CODE_SAME_AS_RAW_BLOCK)
+        unminimized = record_children_obj[:-1] + [code_block(doc.compiled_code)]
+        self.assertEqual(
+            get_bytes_saved('model', doc, page_sections),
+            len(encode_json(unminimized)) - len(encode_json(record_children_obj))
+        )
+
+    def test_exposure_record_has_no_body(self):
+        exposure = DBT_MOCK_MANIFEST_RESOURCES['exposures']['exposure.test.dashboard_1']
+        doc = ExposureDoc.from_node('exposure.test.dashboard_1', exposure, {})
+        record_obj, record_children_obj = build_record('exposure', doc, 'mock_database_id')
+        self.assertEqual(record_obj['properties']['Maturity'], {'select': {'name': 'high'}})
+        self.assertEqual(record_children_obj, [])
+
+
+class TestLoadProjectDocs(unittest.TestCase):
+    def test_loads_each_project_in_order(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            projects = []
+            for project_name, manifest, catalog in [
+                ('a', DBT_MOCK_MANIFEST, DBT_MOCK_CATALOG),
+                ('b', DBT_MOCK_MANIFEST_MULTI, DBT_MOCK_CATALOG_MULTI),
+            ]:
+                os.makedirs(os.path.join(tmp_dir, project_name, 'target'))
+                for artifact_name, artifact in [('manifest', manifest), ('catalog', catalog)]:
+                    with open(os.path.join(tmp_dir, project_name, 'target', f'{artifact_name}.json'), 'w') as f:
+                        json.dump(artifact, f)
+                projects.append({
+                    'project_dir': os.path.join(tmp_dir, project_name),
+                    'database_names': {'model': f'{project_name} Models'},
+                })
+
+            result = load_project_docs(projects)
+
+        self.assertEqual(result, [
+            extract_project_docs(projects[0], DBT_MOCK_MANIFEST, DBT_MOCK_CATALOG),
+            extract_project_docs(projects[1], DBT_MOCK_MANIFEST_MULTI, DBT_MOCK_CATALOG_MULTI),
+        ])
+        self.assertEqual(list(result[1]), [('model', 'b Models')])
+
+
+class TestDatabaseDirectory(unittest.TestCase):
+    def setUp(self):
+        self.recorded_requests = []
+        self.children_pages = [
+            {'results': [{'id': 'other_id', 'child_database': {'title': 'Other'}}],
+             'has_more': True, 'next_cursor': 'mock_cursor'},
+            {'results': [{'id': 'models_id', 'child_database': {'title': 'dbt Models'}}],
+             'has_more': False},
+        ]
+        self.databases = {
+            'models_id': {'title': [{'plain_text': 'dbt Models'}], 'parent': {'page_id': 'parent-id'}},
+        }
+        self.mock_make_request = patch('dbt_docs_to_notion.make_request').start()
+        self.mock_make_request.side_effect = self._mocked_make_request
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.cache_dir = cache_dir.name
+
+    def tearDown(self):
+        patch.stopall()
+
+    def _mocked_make_request(self, endpoint, querystring, method, **request_kwargs):
+        self.recorded_requests.append((endpoint, querystring, request_kwargs.get('params')))
+        if endpoint == 'blocks/':
+            cursor = (request_kwargs.get('params') or {}).get('start_cursor')
+            return self.children_pages[1 if cursor == 'mock_cursor' else 0]
+        database_id = endpoint.split('/')[-1]
+        if database_id not in self.databases:
+            raise NotionAPIError(404, 'Could not find database')
+        return self.databases[database_id]
+
+    def test_scan_follows_pagination(self):
+        databases = DatabaseDirectory('parent_id', Mock())
+        self.assertEqual(databases.find('model', 'dbt Models'), 'models_id')
+        self.assertEqual(databases.find('seed', 'dbt Seeds'), None)
+        self.assertEqual(self.recorded_requests, [
+            ('blocks/', 'parent_id/children', None),
+            ('blocks/', 'parent_id/children', {'start_cursor': 'mock_cursor'}),
+        ])
+
+    def test_pinned_id_skips_lookups(self):
+        databases = DatabaseDirectory('parent_id', Mock(), {'dbt Models': 'pinned_id'})
+        self.assertEqual(databases.find('model', 'dbt Models'), 'pinned_id')
+        self.assertEqual(self.recorded_requests, [])
+
+    def test_pinned_id_is_only_used_for_its_database_name(self):
+        databases = DatabaseDirectory('parent_id', Mock(), {'dbt Models': 'pinned_id'})
+        self.assertEqual(databases.find('model', 'Marketing Models'), None)
+
+    def test_cached_id_skips_scan_on_later_runs(self):
+        cache_path = os.path.join(self.cache_dir, 'cache', 'database_ids.json')
+        DatabaseDirectory('parentid', Mock(), cache_path=cache_path).find('model', 'dbt Models')
+        self.recorded_requests.clear()
+
+        databases = DatabaseDirectory('parentid', Mock(), cache_path=cache_path)
+        self.assertEqual(databases.find('model', 'dbt Models'), 'models_id')
+        self.assertEqual(self.recorded_requests, [('databases/models_id', '', None)])
+
+    def test_stale_cached_id_falls_back_to_scan(self):
+        cache_path = os.path.join(self.cache_dir, 'database_ids.json')
+        with open(cache_path, 'w') as f:
+            json.dump({'parentid': {'dbt Models': 'deleted_id', 'dbt Seeds': 'deleted_seeds_id'}}, f)
+
+        databases = DatabaseDirectory('parentid', Mock(), cache_path=cache_path)
+        self.assertEqual(databases.find('model', 'dbt Models'), 'models_id')
+        self.assertEqual(databases.find('seed', 'dbt Seeds'), None)
+        databases.remember('dbt Snapshots', 'snapshots_id')
+
+        with open(cache_path) as f:
+            self.assertEqual(json.load(f), {'parentid': {'dbt Models': 'models_id', 'dbt Snapshots': 'snapshots_id'}})
+        self.assertEqual([request[0] for request in self.recorded_requests].count('blocks/'), 2)
+
+
+class TestReadProjectsConfig(unittest.TestCase):
+    def test_reads_paths_and_database_overrides(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump({'projects': ['a', {'project_dir': 'b', 'database_names': {'model': 'B Models'}}]}, f)
+        self.addCleanup(os.remove, f.name)
+
+        projects = read_projects_config(f.name, {'model': 'Models', 'source': 'Sources'})
+
+        self.assertEqual([project['project_dir'] for project in projects], ['a', 'b'])
+        self.assertEqual(projects[0]['database_names']['model'], 'Models')
+        self.assertEqual(projects[1]['database_names']['source'], 'Sources')
+        self.assertEqual(projects[1]['database_names']['model'], 'B Models')
+
+
+class TestGroupSyncTasks(unittest.TestCase):
+    def test_projects_sharing_a_database_are_merged(self):
+        projects = [
+            {'project_dir': 'a', 'database_names': {'model': 'Models'}},
+            {'project_dir': 'b', 'database_names': {'model': 'Models'}},
+        ]
+        sync_tasks = group_sync_tasks(
+            projects,
+            [(DBT_MOCK_MANIFEST, DBT_MOCK_CATALOG), (DBT_MOCK_MANIFEST_MULTI, DBT_MOCK_CATALOG_MULTI)]
+        )
+        docs = sync_tasks[('model', 'Models')]
+        self.assertEqual(list(sync_tasks), [('model', 'Models')])
+        self.assertEqual(set(docs), {'model.test.model_1', 'model.test.model_2'})
+        self.assertEqual(docs['model.test.model_2'].approx_rows, 5)
+
+    def test_database_shared_across_resource_types_is_rejected(self):
+        projects = [
+            {'project_dir': 'a', 'database_names': {'model': 'Docs'}},
+            {'project_dir': 'b', 'database_names': {'seed': 'Docs'}},
+        ]
+        with self.assertRaises(ValueError):
+            group_sync_tasks(projects, [(DBT_MOCK_MANIFEST, DBT_MOCK_CATALOG)] * 2)
+
+
+    def test_records_sharing_a_name_in_one_database_are_rejected(self):
+        projects = [
+            {'project_dir': 'a', 'database_names': {'model': 'Models'}},
+            {'project_dir': 'b', 'database_names': {'model': 'Models'}},
+        ]
+        other_manifest = copy.deepcopy(DBT_MOCK_MANIFEST)
+        other_manifest['nodes'] = {
+            unique_id.replace('.test.', '.other.'): node for unique_id, node in other_manifest['nodes'].items()
+        }
+        with self.assertRaisesRegex(ValueError, 'several records named model_1'):
+            group_sync_tasks(projects, [(DBT_MOCK_MANIFEST, DBT_MOCK_CATALOG), (other_manifest, DBT_MOCK_CATALOG)])
+
+
+    def test_versioned_models_get_a_record_each(self):
+        project = {'project_dir': 'a', 'database_names': {'model': 'Models'}}
+        versioned_manifest = copy.deepcopy(DBT_MOCK_MANIFEST)
+        node = versioned_manifest['nodes'].pop('model.test.model_1')
+        for version in (1, 2):
+            versioned_manifest['nodes'][f'model.test.model_1.v{version}'] = {**node, 'version': version}
+
+        sync_tasks = group_sync_tasks([project], [(versioned_manifest, DBT_MOCK_CATALOG)])
+
+        self.assertEqual(
+            {unique_id: doc.name for unique_id, doc in sync_tasks[('model', 'Models')].items()},
+            {'model.test.model_1.v1': 'model_1_v1', 'model.test.model_1.v2': 'model_1_v2'}
+        )
+
+
+class TestJsonCodec(unittest.TestCase):
+    codecs = ['stdlib'] + (['orjson'] if dbt_docs_to_notion.orjson is not None else [])
+
+    def _use_codec(self, codec):
+        if codec == 'stdlib':
+            return patch('dbt_docs_to_notion.orjson', None)
+        return patch('dbt_docs_to_notion.orjson', dbt_docs_to_notion.orjson)
+
+    def test_encode_json_matches_across_codecs(self):
+        obj = {'b': 'é', 'a': [1, 2.5, None, True]}
+        for codec in self.codecs:
+            with self.subTest(codec=codec), self._use_codec(codec):
+                self.assertEqual(
+                    encode_json(obj, sort_keys=True),
+                    '{"a":[1,2.5,null,true],"b":"é"}'.encode('utf-8')
+                )
+
+    def test_load_json_artifact(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', encoding='utf-8', delete=False) as f:
+            json.dump(DBT_MOCK_MANIFEST, f)
+        self.addCleanup(os.remove, f.name)
+        for codec in self.codecs:
+            with self.subTest(codec=codec), self._use_codec(codec):
+                self.assertEqual(load_json_artifact(f.name), DBT_MOCK_MANIFEST)
+
+
 if __name__ == '__main__':
     unittest.main()